@@ -0,0 +1,45 @@
+// Onglet "Focus on a Keyword" : rendu dans le navigateur à partir du bundle de
+// la Search Query choisie (update_query_bundle dans first.py). Changer de date
+// ne fait aucun aller-retour avec le serveur.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    focus: {
+        // Dates existantes de la query
+        date_options: function (bundle) {
+            if (!bundle) {
+                return [];
+            }
+            return bundle.dates.map(function (date) {
+                return {label: date, value: date};
+            });
+        },
+
+        // Valeurs des cartes KPI, funnel et graphique des Δ pour (query, date).
+        // Les figures de app.layout sont copiées, seules les données changent
+        render: function (date, bundle, funnel, delta) {
+            var count = dash_clientside.callback_context.outputs_list[0].length;
+            var values = bundle && date ? bundle.values[date] : undefined;
+
+            var funnelChart = Object.assign({}, funnel);
+            funnelChart.data = [Object.assign({}, funnel.data[0], {x: values ? bundle.funnel[date] : []})];
+
+            // La série des Δ ne dépend que de la query ; la date choisie y est marquée
+            var series = bundle ? bundle.delta : {x: [], ctr: [], cvr: []};
+            var deltaChart = Object.assign({}, delta);
+            deltaChart.data = [
+                Object.assign({}, delta.data[0], {x: series.x, y: series.ctr}),
+                Object.assign({}, delta.data[1], {x: series.x, y: series.cvr})
+            ];
+            deltaChart.layout = Object.assign({}, delta.layout, {
+                shapes: values ? [{
+                    type: 'line', xref: 'x', yref: 'paper', x0: date, x1: date, y0: 0, y1: 1,
+                    line: {color: 'grey', dash: 'dot'}
+                }] : []
+            });
+
+            if (!values) {
+                return [new Array(count).fill(null), funnelChart, deltaChart];
+            }
+            return [values, funnelChart, deltaChart];
+        }
+    }
+});
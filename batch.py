@@ -0,0 +1,132 @@
+# Calcul des KPIs et des stratégies en ligne de commande, sans démarrer Dash.
+#
+# Lit tous les rapports Search Query Performance d'un dossier ou d'un glob, les
+# traite en parallèle avec la même lecture (ingest) et le même moteur de KPIs
+# (kpi) que l'application, puis écrit un résumé par Search Query et par date.
+#
+#     python batch.py rapports/ -o resume.parquet
+#     python batch.py "exports/**/*.csv" -o resume.csv --workers 8
+#     python batch.py rapports/ -o resume.parquet --alerts alertes.csv
+#
+# --alerts écrit aussi la vue "Alerts" de l'application (trends) : changements de
+# stratégie et anomalies de Δ_CTR / Δ_CVR au dernier rapport de chaque query.
+#
+# N'importe que pandas / numpy (et pyarrow pour le Parquet) : pas de Dash ni de plotly.
+import argparse
+import glob
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from ingest import INGEST_WORKERS, read_report
+from kpi import compute_kpis
+from trends import alerts, compute_trends
+
+logger = logging.getLogger('batch')
+
+SUMMARY_COLUMNS = [
+    'Source File', 'Search Query', 'Reporting Date',
+    'Impressions: Total Count', 'Impressions: Brand Count',
+    'Clicks: Total Count', 'Clicks: Brand Count',
+    'Basket Adds: Total Count', 'Basket Adds: Brand Count',
+    'Purchases: Total Count', 'Purchases: Brand Count',
+    'Market_CTR', 'Brand_CTR', 'Δ_CTR', 'Market_CVR', 'Brand_CVR', 'Δ_CVR', 'strategy',
+]
+
+
+# Fichiers CSV désignés par une liste de dossiers, fichiers ou motifs glob
+def find_reports(inputs):
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = glob.glob(os.path.join(item, '**', '*.csv'), recursive=True)
+        else:
+            matches = glob.glob(item, recursive=True)
+        if not matches:
+            logger.warning("No report matches %s", item)
+        paths.extend(matches)
+    # Ordre déterministe, sans doublons
+    return sorted(set(os.path.abspath(path) for path in paths))
+
+
+# Lire un rapport et calculer ses KPIs (exécuté dans un processus du pool)
+def process_report(path, engine=None):
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        df = compute_kpis(read_report(data, engine=engine), inplace=True)
+    except Exception as e:
+        return path, None, f"{type(e).__name__}: {e}"
+
+    df.insert(0, 'Source File', os.path.basename(path))
+    return path, df[[col for col in SUMMARY_COLUMNS if col in df.columns]], None
+
+
+def run(paths, workers=None, engine=None):
+    workers = workers or INGEST_WORKERS
+    if workers <= 1 or len(paths) <= 1:
+        outcomes = [process_report(path, engine) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            outcomes = list(executor.map(process_report, paths, [engine] * len(paths)))
+
+    frames, errors = [], []
+    for path, df, error in outcomes:
+        if error is not None:
+            logger.error("Failed to process %s: %s", path, error)
+            errors.append((path, error))
+        else:
+            frames.append(df)
+
+    if not frames:
+        return pd.DataFrame(columns=SUMMARY_COLUMNS), errors
+
+    summary = pd.concat(frames, ignore_index=True)
+    summary = summary.sort_values(['Search Query', 'Reporting Date', 'Source File'], kind='stable')
+    return summary.reset_index(drop=True), errors
+
+
+def write_summary(summary, output):
+    if output.endswith('.parquet'):
+        summary.to_parquet(output, index=False)
+    else:
+        summary.to_csv(output, index=False, date_format='%Y-%m-%d')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compute KPIs and strategies for Search Query Performance reports.")
+    parser.add_argument('inputs', nargs='+', help="report directories, files or glob patterns")
+    parser.add_argument('-o', '--output', required=True, help="summary file (.parquet or .csv)")
+    parser.add_argument('--workers', type=int, default=None, help="number of processes (default: CPU count)")
+    parser.add_argument('--engine', choices=['c', 'pyarrow'], default=None, help="CSV parser engine")
+    parser.add_argument('--alerts', default=None,
+                        help="also write strategy changes and Δ anomalies per query (.parquet or .csv)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    paths = find_reports(args.inputs)
+    if not paths:
+        logger.error("No report found")
+        return 1
+
+    start = time.perf_counter()
+    summary, errors = run(paths, workers=args.workers, engine=args.engine)
+    write_summary(summary, args.output)
+    logger.info("Processed %d/%d reports (%d rows) in %.1fs -> %s",
+                len(paths) - len(errors), len(paths), len(summary), time.perf_counter() - start, args.output)
+
+    if args.alerts:
+        start = time.perf_counter()
+        flagged = alerts(compute_trends(summary))
+        write_summary(flagged, args.alerts)
+        logger.info("Flagged %d queries in %.1fs -> %s", len(flagged), time.perf_counter() - start, args.alerts)
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
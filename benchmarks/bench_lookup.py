@@ -0,0 +1,88 @@
+# Latence de la sélection (Search Query, Reporting Date) selon la taille du jeu de données.
+#
+# Compare l'ancienne recherche par masques booléens à l'index de Dataset, et
+# mesure update_query_bundle appelé directement. Avec l'index, la latence doit
+# rester stable quand le nombre de lignes augmente.
+#
+#     python benchmarks/bench_lookup.py [--weeks 52] [--queries 1000 10000 20000]
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dataset import Dataset  # noqa: E402
+from generate_reports import FIRST_WEEK, generate_frame, query_names  # noqa: E402
+from kpi import compute_kpis  # noqa: E402
+
+
+# DataFrame enrichi de n_queries x n_weeks lignes, comme après update_table
+def make_frame(n_queries, n_weeks, seed=0):
+    return compute_kpis(generate_frame(n_queries, n_weeks, seed))
+
+
+def _median_ms(fn, picks):
+    timings = []
+    for query, date in picks:
+        start = time.perf_counter()
+        fn(query, date)
+        timings.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(timings), 3)
+
+
+def run(query_counts, n_weeks, repeats):
+    import first
+
+    rng = np.random.default_rng(1)
+    results = []
+    for n_queries in query_counts:
+        df = make_frame(n_queries, n_weeks)
+        start = time.perf_counter()
+        dataset = Dataset(df)
+        build_ms = (time.perf_counter() - start) * 1000
+        key = first.dataset_store.put(dataset)
+
+        queries = query_names(n_queries)
+        dates = pd.date_range(FIRST_WEEK, periods=n_weeks, freq='7D').strftime('%Y-%m-%d')
+        picks = [(queries[rng.integers(n_queries)], dates[rng.integers(n_weeks)]) for _ in range(repeats)]
+
+        def legacy_lookup(query, date):
+            filtered = df[(df['Search Query'] == query) & (df['Reporting Date'] == pd.to_datetime(date))]
+            graph = df[(df['Search Query'] == query)]
+            return filtered.iloc[0], graph
+
+        def indexed_lookup(query, date):
+            return dataset.row(query, date), dataset.series(query)
+
+        # Vider le cache de rendu pour mesurer le calcul complet du callback
+        def callback(query, date):
+            first.render_cache.clear()
+            return first.update_query_bundle(query, key)
+
+        results.append({
+            'rows': len(df),
+            'index_build_ms': round(build_ms, 1),
+            'legacy_lookup_ms': _median_ms(legacy_lookup, picks),
+            'indexed_lookup_ms': _median_ms(indexed_lookup, picks),
+            'update_query_bundle_ms': _median_ms(callback, picks),
+        })
+        first.dataset_store.delete(key)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark keyword/date lookups as the dataset grows.")
+    parser.add_argument('--queries', type=int, nargs='+', default=[1000, 5000, 20000])
+    parser.add_argument('--weeks', type=int, default=52)
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'index build':>12} {'legacy':>10} {'indexed':>10} {'callback':>10}  (ms)")
+    for r in run(args.queries, args.weeks, args.repeats):
+        print(f"{r['rows']:>10} {r['index_build_ms']:>12} {r['legacy_lookup_ms']:>10} "
+              f"{r['indexed_lookup_ms']:>10} {r['update_query_bundle_ms']:>10}")
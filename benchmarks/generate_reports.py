@@ -0,0 +1,145 @@
+# Générateur de rapports "Search Query Performance" synthétiques.
+#
+# Produit N queries x M semaines avec exactement les colonnes lues par
+# update_table / update_query_bundle, précédées de la ligne de métadonnées que
+# read_csv(skiprows=1) ignore. Les valeurs respectent l'entonnoir
+# impressions >= clics >= paniers >= achats, et la part de la marque reste
+# inférieure au total.
+#
+#     python benchmarks/generate_reports.py out_dir --queries 10000 --weeks 52
+import argparse
+import base64
+import os
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = [
+    'Search Query', 'Search Query Score', 'Search Query Volume',
+    'Impressions: Total Count', 'Impressions: Brand Count', 'Impressions: Brand Share %',
+    'Clicks: Total Count', 'Clicks: Click Rate %', 'Clicks: Brand Count', 'Clicks: Brand Share %',
+    'Clicks: Price (Median)', 'Clicks: Brand Price (Median)',
+    'Clicks: Same-Day Shipping Speed', 'Clicks: 1D-Shipping Speed', 'Clicks: 2D-Shipping Speed',
+    'Basket Adds: Total Count', 'Basket Adds: Basket Add Rate %', 'Basket Adds: Brand Count',
+    'Basket Adds: Brand Share %', 'Basket Adds: Price (Median)', 'Basket Adds: Brand Price (Median)',
+    'Basket Adds: Same-Day Shipping Speed', 'Basket Adds: 1D-Shipping Speed', 'Basket Adds: 2D-Shipping Speed',
+    'Purchases: Total Count', 'Purchases: Purchase Rate %', 'Purchases: Brand Count',
+    'Purchases: Brand Share %', 'Purchases: Price (Median)', 'Purchases: Brand Price (Median)',
+    'Purchases: Same-Day Shipping Speed', 'Purchases: 1D-Shipping Speed', 'Purchases: 2D-Shipping Speed',
+    'Reporting Date',
+]
+
+FIRST_WEEK = pd.Timestamp('2023-01-07')
+
+_WORDS = ['organic', 'protein', 'powder', 'vegan', 'bar', 'chocolate', 'vanilla', 'snack', 'keto',
+          'whey', 'gluten', 'free', 'energy', 'drink', 'low', 'sugar', 'peanut', 'butter', 'oat', 'bites']
+
+
+# Libellés de queries uniques et lisibles ("vegan protein bar 12")
+def query_names(n_queries, seed=0):
+    rng = np.random.default_rng(seed)
+    words = np.array(_WORDS)
+    picks = rng.integers(0, len(words), size=(n_queries, 3))
+    return [f"{' '.join(words[p])} {i}" for i, p in enumerate(picks)]
+
+
+def _share(brand, total):
+    return np.round(np.divide(brand * 100.0, total, out=np.zeros(len(total)), where=total > 0), 2)
+
+
+# Rapport d'une semaine (DataFrame brut, colonnes dans l'ordre de l'export)
+def generate_week(queries, week, seed=0):
+    rng = np.random.default_rng([seed, week])
+    n = len(queries)
+
+    # Volume de recherche en loi de puissance : quelques queries très fréquentes
+    volume = np.maximum(1, (rng.pareto(1.2, n) * 200).astype('int64'))
+    impressions = volume * rng.integers(5, 40, n)
+    brand_impressions = rng.binomial(impressions, rng.uniform(0.01, 0.4, n))
+    clicks = rng.binomial(impressions, rng.uniform(0.005, 0.08, n))
+    brand_clicks = rng.binomial(clicks, rng.uniform(0.0, 0.5, n))
+    baskets = rng.binomial(clicks, rng.uniform(0.05, 0.3, n))
+    brand_baskets = rng.binomial(baskets, rng.uniform(0.0, 0.5, n))
+    purchases = rng.binomial(baskets, rng.uniform(0.2, 0.7, n))
+    brand_purchases = rng.binomial(purchases, rng.uniform(0.0, 0.5, n))
+    price = np.round(rng.uniform(5, 80, n), 2)
+
+    data = {
+        'Search Query': queries,
+        'Search Query Score': np.arange(1, n + 1),
+        'Search Query Volume': volume,
+        'Impressions: Total Count': impressions,
+        'Impressions: Brand Count': brand_impressions,
+        'Impressions: Brand Share %': _share(brand_impressions, impressions),
+    }
+    for stage, total, brand in (('Clicks', clicks, brand_clicks),
+                                ('Basket Adds', baskets, brand_baskets),
+                                ('Purchases', purchases, brand_purchases)):
+        rate_column = {'Clicks': 'Clicks: Click Rate %',
+                       'Basket Adds': 'Basket Adds: Basket Add Rate %',
+                       'Purchases': 'Purchases: Purchase Rate %'}[stage]
+        same_day = rng.binomial(total, 0.1)
+        one_day = rng.binomial(total - same_day, 0.4)
+        data.update({
+            f'{stage}: Total Count': total,
+            rate_column: _share(total, volume),
+            f'{stage}: Brand Count': brand,
+            f'{stage}: Brand Share %': _share(brand, total),
+            f'{stage}: Price (Median)': price,
+            f'{stage}: Brand Price (Median)': np.round(price * rng.uniform(0.8, 1.3, n), 2),
+            f'{stage}: Same-Day Shipping Speed': same_day,
+            f'{stage}: 1D-Shipping Speed': one_day,
+            f'{stage}: 2D-Shipping Speed': rng.binomial(total - same_day - one_day, 0.5),
+        })
+    data['Reporting Date'] = (FIRST_WEEK + pd.Timedelta(weeks=week)).strftime('%Y-%m-%d')
+    return pd.DataFrame(data)[COLUMNS]
+
+
+# Toutes les semaines dans un seul DataFrame typé (sans passer par le CSV)
+def generate_frame(n_queries, n_weeks, seed=0):
+    queries = query_names(n_queries, seed)
+    df = pd.concat([generate_week(queries, week, seed) for week in range(n_weeks)], ignore_index=True)
+    df['Reporting Date'] = pd.to_datetime(df['Reporting Date'])
+    return df
+
+
+# Texte CSV d'un rapport, avec la ligne de métadonnées de l'export Amazon
+def report_csv(df, brand='Synthetic'):
+    week = df['Reporting Date'].iloc[0]
+    header = f'"Brand=[""{brand}""]","Reporting Range=[""Weekly""]","Select week=[""{week}""]"\n'
+    return header + df.to_csv(index=False)
+
+
+# Contenu "data:...;base64,..." tel qu'envoyé par dcc.Upload
+def upload_contents(text):
+    return 'data:text/csv;base64,' + base64.b64encode(text.encode('utf-8')).decode('ascii')
+
+
+# Un rapport CSV par semaine, comme des exports hebdomadaires
+def generate_reports(n_queries, n_weeks, seed=0):
+    queries = query_names(n_queries, seed)
+    for week in range(n_weeks):
+        yield week, report_csv(generate_week(queries, week, seed))
+
+
+def write_reports(directory, n_queries, n_weeks, seed=0):
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for week, text in generate_reports(n_queries, n_weeks, seed):
+        path = os.path.join(directory, f"search_query_performance_week_{week + 1:03d}.csv")
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            f.write(text)
+        paths.append(path)
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate synthetic Search Query Performance reports.")
+    parser.add_argument('directory')
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--weeks', type=int, default=52)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    paths = write_reports(args.directory, args.queries, args.weeks, args.seed)
+    print(f"Wrote {len(paths)} reports of {args.queries} queries to {args.directory}")
@@ -0,0 +1,153 @@
+# Suite de benchmarks de l'application, résultats en JSON.
+#
+# Sur des rapports synthétiques (generate_reports), mesure :
+#   - la lecture des fichiers envoyés (sans puis avec le cache des rapports),
+#   - le calcul des KPIs et de la stratégie,
+#   - les callbacks update_table, update_raw_table, search_queries et update_query_bundle
+#     appelés directement (les changements de date sont rendus dans le navigateur),
+#   - la taille des réponses sérialisées comme Dash les envoie au navigateur.
+#
+# Le fichier JSON produit permet de comparer deux commits :
+#     python benchmarks/run_benchmarks.py --queries 2000 --weeks 52 -o bench.json
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from generate_reports import generate_frame, generate_reports, upload_contents  # noqa: E402
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def _median(values):
+    return round(statistics.median(values), 3)
+
+
+# Taille en octets de la réponse JSON, sérialisée avec l'encodeur utilisé par Dash
+def payload_bytes(value):
+    from plotly.io.json import to_json_plotly
+
+    return len(to_json_plotly(value).encode('utf-8'))
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(n_queries, n_weeks, repeats, seed=0):
+    import first
+    from ingest import ingest_many
+    from kpi import compute_kpis
+    from report_cache import get_report_cache
+
+    results = {}
+
+    # Lecture des fichiers envoyés
+    contents = [upload_contents(text) for week, text in generate_reports(n_queries, n_weeks, seed)]
+    filenames = [f"week_{week + 1:03d}.csv" for week in range(n_weeks)]
+    results['upload_bytes'] = sum(len(content) for content in contents)
+
+    _, results['ingest_cold_ms'] = _timed(ingest_many, contents, filenames)
+    if get_report_cache() is not None:
+        _, results['ingest_cached_ms'] = _timed(ingest_many, contents, filenames)
+
+    # Calcul des KPIs sur le DataFrame brut combiné
+    raw = generate_frame(n_queries, n_weeks, seed)
+    results['rows'] = len(raw)
+    _, results['compute_kpis_ms'] = _timed(compute_kpis, raw)
+
+    # Callback d'import, sur d'autres rapports pour ne pas profiter du cache
+    contents = [upload_contents(text) for week, text in generate_reports(n_queries, n_weeks, seed + 1)]
+    output, results['update_table_ms'] = _timed(first.update_table, contents, filenames)
+    table, key = output
+    results['update_table_response_bytes'] = payload_bytes(list(output))
+
+    # Première page de la table des données brutes
+    page, results['update_raw_table_ms'] = _timed(
+        first.update_raw_table, 0, first.RAW_TABLE_PAGE_SIZE, [], '', key)
+    results['update_raw_table_response_bytes'] = payload_bytes(list(page))
+
+    # Options du dropdown des queries : bornées par QUERY_OPTIONS_LIMIT quel que soit le nombre de queries
+    options, results['search_queries_ms'] = _timed(first.search_queries, 'protein', key, None)
+    results['search_queries_response_bytes'] = payload_bytes(options)
+
+    # Focus sur un mot-clé : bundle complet de la query puis bundle servi par le cache
+    rng = np.random.default_rng(seed)
+    dataset = first.dataset_store.get(key)
+    picks = [dataset.queries[rng.integers(len(dataset.queries))] for _ in range(repeats)]
+    cold, warm, sizes = [], [], []
+    for query in picks:
+        first.render_cache.clear()
+        bundle, elapsed = _timed(first.update_query_bundle, query, key)
+        cold.append(elapsed)
+        sizes.append(payload_bytes(bundle))
+        _, elapsed = _timed(first.update_query_bundle, query, key)
+        warm.append(elapsed)
+    results['update_query_bundle_ms'] = _median(cold)
+    results['update_query_bundle_cached_ms'] = _median(warm)
+    results['update_query_bundle_response_bytes'] = int(statistics.median(sizes))
+
+    for name, value in results.items():
+        if name.endswith('_ms'):
+            results[name] = round(value, 3)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the AmazonKPI benchmark suite.")
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--weeks', type=int, default=12)
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help="JSON result file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    # Stockage et cache isolés pour ne pas mesurer (ni polluer) ceux de l'application
+    workdir = tempfile.mkdtemp(prefix='amazonkpi-bench-')
+    os.environ['AMAZONKPI_STORE_DIR'] = os.path.join(workdir, 'store')
+    os.environ['AMAZONKPI_REPORT_CACHE_DIR'] = os.path.join(workdir, 'reports')
+
+    try:
+        results = run(args.queries, args.weeks, args.repeats, args.seed)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'commit': _git_commit(),
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'params': {'queries': args.queries, 'weeks': args.weeks, 'repeats': args.repeats, 'seed': args.seed},
+        'results': results,
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+# Stockage côté serveur des jeux de données de session.
+#
+# Le navigateur ne conserve qu'une clé (handle) dans dcc.Store ; les DataFrames
+# restent sur le serveur. Un cache LRU en mémoire sert les lectures répétées et
+# un backend disque optionnel (un fichier pickle par clé) permet de partager les
+# données entre plusieurs workers gunicorn. Chaque upload produit une nouvelle
+# clé : une valeur enregistrée n'est jamais modifiée, donc les caches mémoire des
+# différents workers ne peuvent pas devenir incohérents.
+#
+# Les fichiers sont relus avec pickle : le dossier est privé (0700) et propre à
+# l'utilisateur, et un fichier qui ne lui appartient pas n'est jamais chargé.
+import logging
+import os
+import pickle
+import re
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+_KEY_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+# Dossier temporaire par défaut, propre à l'utilisateur courant
+def user_temp_path(name):
+    user = os.getuid() if hasattr(os, 'getuid') else os.environ.get('USERNAME', 'user')
+    return os.path.join(tempfile.gettempdir(), f"{name}-{user}")
+
+
+# Créer (ou vérifier) un dossier privé : il doit appartenir à l'utilisateur
+# courant, et ses droits sont ramenés à 0700. PermissionError sinon
+def private_directory(directory):
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    if not hasattr(os, 'getuid'):
+        return directory
+    st = os.stat(directory)
+    if st.st_uid != os.getuid():
+        raise PermissionError(f"{directory} is owned by another user (uid {st.st_uid})")
+    if st.st_mode & 0o077:
+        os.chmod(directory, 0o700)
+    return directory
+
+
+# Un fichier ouvert peut être chargé s'il appartient à l'utilisateur courant
+def _owned(f):
+    return not hasattr(os, 'getuid') or os.fstat(f.fileno()).st_uid == os.getuid()
+
+
+# Cache LRU thread-safe de taille bornée
+class LRUCache:
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def keys(self):
+        with self._lock:
+            return list(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+# Magasin de jeux de données indexé par clé de session / d'upload
+class DatasetStore:
+    def __init__(self, max_items=16, directory=None, max_age=24 * 3600):
+        self._memory = LRUCache(max_items)
+        self.directory = directory
+        self.max_age = max_age
+        if directory is not None:
+            private_directory(directory)
+
+    @staticmethod
+    def new_key():
+        return uuid.uuid4().hex
+
+    @staticmethod
+    def is_valid_key(key):
+        return isinstance(key, str) and _KEY_PATTERN.match(key) is not None
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    # Enregistrer une valeur et retourner sa clé
+    def put(self, value, key=None):
+        if key is None:
+            key = self.new_key()
+        elif not self.is_valid_key(key):
+            raise ValueError(f"Invalid dataset key: {key!r}")
+
+        self._memory.put(key, value)
+
+        if self.directory is not None:
+            # Écriture atomique : les autres workers ne voient jamais un fichier partiel
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, self._path(key))
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            self._purge_expired()
+
+        return key
+
+    # Lire une valeur ; None si la clé est inconnue ou expirée
+    def get(self, key):
+        if not self.is_valid_key(key):
+            return None
+
+        value = self._memory.get(key)
+        if self.directory is None:
+            return value
+
+        path = self._path(key)
+        if value is not None:
+            # Rafraîchir la date d'accès à chaque lecture, même servie par la
+            # mémoire : sinon _purge_expired supprime un jeu de données utilisé
+            # et les autres workers le perdent
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+            return value
+
+        try:
+            with open(path, 'rb') as f:
+                if not _owned(f):
+                    logger.warning("Ignoring %s: not owned by the current user", path)
+                    return None
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        # Rafraîchir la date d'accès pour l'expiration côté disque
+        os.utime(path)
+        self._memory.put(key, value)
+        return value
+
+    def delete(self, key):
+        if not self.is_valid_key(key):
+            return
+        self._memory.pop(key)
+        if self.directory is not None:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    # Supprimer du disque les jeux de données non consultés depuis max_age secondes
+    def _purge_expired(self):
+        if self.max_age is None:
+            return
+        limit = time.time() - self.max_age
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.name.endswith('.pkl') and entry.stat().st_mtime < limit:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+
+# Construire le magasin par défaut à partir des variables d'environnement
+def store_from_env():
+    backend = os.environ.get('AMAZONKPI_STORE_BACKEND', 'disk')
+    max_items = int(os.environ.get('AMAZONKPI_STORE_MAX_ITEMS', '16'))
+    max_age = float(os.environ.get('AMAZONKPI_STORE_MAX_AGE', str(24 * 3600)))
+
+    if backend == 'memory':
+        # Uniquement valable avec un seul worker gunicorn
+        return DatasetStore(max_items=max_items, max_age=max_age)
+    if backend != 'disk':
+        raise ValueError(f"Unknown AMAZONKPI_STORE_BACKEND: {backend!r}")
+
+    directory = os.environ.get('AMAZONKPI_STORE_DIR', user_temp_path('amazonkpi-store'))
+    return DatasetStore(max_items=max_items, directory=directory, max_age=max_age)
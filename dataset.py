@@ -0,0 +1,320 @@
+# Jeu de données de session indexé par (Search Query, Reporting Date).
+#
+# L'index est construit une seule fois à l'import : pour chaque Search Query, les
+# positions de ses lignes triées par date. Sélectionner un mot-clé coûte alors
+# une recherche dans un dict, et une date une recherche dichotomique parmi les k
+# semaines de ce mot-clé, au lieu de deux masques booléens sur tout le DataFrame.
+#
+# append() ajoute de nouveaux rapports sans reconstruire l'index : seules les
+# Search Query touchées par les nouvelles lignes sont mises à jour.
+#
+# Le DataFrame est gardé sous une forme compacte (voir compact) : c'est lui qui
+# occupe la mémoire du serveur, une copie par session. Les agrégats de l'onglet
+# "Portfolio" (rollup) et l'index de recherche des queries (search) sont
+# calculés en même temps que l'index.
+import numpy as np
+import pandas as pd
+
+from query_index import QueryIndex
+from rollup import RollupCube
+from trends import alerts, compute_trends
+
+CATEGORY_COLUMNS = ['Search Query', 'strategy']
+
+
+# Décimales des flottants affichés (table des données, onglet "Focus on a Keyword"),
+# comme le round(1) d'origine. Le jeu de données garde les valeurs exactes, dont
+# se servent les alertes et les exports
+DISPLAY_DECIMALS = 1
+
+# Nombre maximal de décimales d'une colonne gardée en float32
+FLOAT32_DECIMALS = 4
+
+
+# Valeurs décimales (float64) d'un tableau float32 : arrondies au plus petit
+# nombre de décimales (au plus FLOAT32_DECIMALS) qui redonne exactement les
+# mêmes float32. None si aucun ne convient
+def _decimal_values(values):
+    wide = values.astype('float64')
+    for decimals in range(FLOAT32_DECIMALS + 1):
+        rounded = np.round(wide, decimals)
+        if np.array_equal(rounded.astype('float32'), values, equal_nan=True):
+            return rounded
+    return None
+
+
+# Tableau float32 repassé en float64 par ses valeurs décimales (12.3 et non
+# 12.300000190734863) ; les autres tableaux sont seulement convertis en float64
+def widen_values(values):
+    if values.dtype != 'float32':
+        return values.astype('float64')
+    wide = _decimal_values(values)
+    # Colonne float32 qui ne vient pas de compact : écriture la plus courte, valeur par valeur
+    return wide if wide is not None else values.astype(str).astype('float64')
+
+
+# Une colonne float64 passe en float32 si ses valeurs sont retrouvées exactement
+# par widen_values : taux et prix lus dans les rapports (quelques décimales), mais
+# pas les KPIs calculés ni les comptages entiers au-delà de 2**24
+def _fits_float32(values):
+    # Rejet rapide sur les premières valeurs, avant de tester toute la colonne
+    for sample in (values[:1000], values):
+        narrow = sample.astype('float32')
+        if not np.array_equal(_decimal_values(narrow), sample, equal_nan=True):
+            return False
+    return True
+
+
+# Plus petit type entier qui contient les valeurs, choisi d'après le min / max.
+# compact() précède à chaque import l'index et le cube d'agrégats (rollup) ;
+# pd.to_numeric(downcast=...) vérifie chaque conversion avec isclose et coûtait
+# à lui seul plus que la construction du cube sur des millions de lignes
+def _downcast_integer(values):
+    if len(values) == 0:
+        return values
+    low, high = values.min(), values.max()
+    for dtype in ('int8', 'int16', 'int32'):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return values.astype(dtype)
+    return values
+
+
+# Représentation compacte d'un DataFrame de rapports :
+#   - Search Query et strategy en catégories (un code par ligne au lieu d'une chaîne),
+#   - comptages entiers réduits au plus petit type qui contient leurs valeurs,
+#   - taux et prix en float32 lorsque leurs valeurs sont retrouvées exactement
+#     (voir _fits_float32) ; les KPIs calculés restent en float64,
+#   - dates en datetime64.
+# Les comptages réduits peuvent déborder dans une opération entre colonnes :
+# les élargir (astype('int64')) avant de les additionner ou multiplier.
+def compact(df):
+    columns = {}
+    for col in df.columns:
+        series = df[col]
+        if col in CATEGORY_COLUMNS:
+            if not isinstance(series.dtype, pd.CategoricalDtype):
+                series = series.astype('category')
+        elif col == 'Reporting Date':
+            if not pd.api.types.is_datetime64_any_dtype(series.dtype):
+                series = pd.to_datetime(series, errors='coerce')
+        elif pd.api.types.is_integer_dtype(series.dtype):
+            series = pd.Series(_downcast_integer(series.to_numpy()), index=series.index, name=col)
+        elif series.dtype == 'float64' and _fits_float32(series.to_numpy()):
+            series = series.astype('float32')
+        columns[col] = series
+    return pd.DataFrame(columns, index=df.index)
+
+
+# Colonnes float32 repassées en float64 par leurs valeurs décimales (widen_values)
+def widen(df):
+    float32_columns = [col for col in df.columns if df[col].dtype == 'float32']
+    if not float32_columns:
+        return df
+    df = df.copy()
+    for col in float32_columns:
+        df[col] = widen_values(df[col].to_numpy())
+    return df
+
+
+# Lignes telles qu'affichées : flottants élargis puis arrondis à DISPLAY_DECIMALS
+def for_display(df):
+    df = widen(df)
+    floats = [col for col in df.columns if pd.api.types.is_float_dtype(df[col].dtype)]
+    return df.round({col: DISPLAY_DECIMALS for col in floats}) if floats else df
+
+
+# Mêmes catégories des deux côtés, pour que concat conserve les colonnes catégorielles
+def _union_categories(left, right):
+    left, right = left.copy(deep=False), right.copy(deep=False)
+    for col in CATEGORY_COLUMNS:
+        if col not in left.columns or col not in right.columns:
+            continue
+        if not isinstance(left[col].dtype, pd.CategoricalDtype) or left[col].dtype == right[col].dtype:
+            continue
+        categories = left[col].cat.categories.union(right[col].cat.categories)
+        left[col] = left[col].cat.set_categories(categories)
+        right[col] = right[col].cat.set_categories(categories)
+    return left, right
+
+
+class Dataset:
+    def __init__(self, df):
+        self.df = compact(df)
+        self._build_index()
+        self._build_search()
+        self.rollup = RollupCube(self.df)
+        self._build_alerts()
+
+    def _build_index(self):
+        codes, uniques = pd.factorize(self.df['Search Query'], sort=False)
+        dates = self.df['Reporting Date'].to_numpy(dtype='datetime64[ns]').view('int64')
+
+        # Trier par (query, date) ; lexsort est stable, donc pour un doublon
+        # (query, date) la première ligne importée reste la première trouvée
+        order = np.lexsort((dates, codes))
+        order = order[codes[order] >= 0]
+        boundaries = np.flatnonzero(np.diff(codes[order])) + 1
+
+        self._dates = dates
+        self._by_query = dict(zip(uniques, np.split(order, boundaries)))
+
+        # Options des dropdowns, dans l'ordre d'apparition des valeurs
+        self.queries = list(uniques)
+
+    # Index de recherche des queries, classées par impressions totales
+    def _build_search(self):
+        queries = self.df['Search Query']
+        codes = queries.cat.codes.to_numpy()
+        impressions = self.df['Impressions: Total Count'].fillna(0).to_numpy(dtype='float64')
+        valid = codes >= 0
+        totals = np.bincount(codes[valid], weights=impressions[valid], minlength=len(queries.cat.categories))
+        self.search = QueryIndex(queries.cat.categories, totals)
+
+    # Vue "Alerts" : tendances de toutes les queries calculées en une passe, seul
+    # le dernier rapport signalé de chaque query est gardé
+    def _build_alerts(self):
+        self.alerts = alerts(compute_trends(self.df))
+
+    def __len__(self):
+        return len(self.df)
+
+    # Empreinte mémoire de la session (DataFrame et index), en octets
+    def memory_usage(self):
+        # _dates est une vue sur la colonne Reporting Date, déjà comptée avec le DataFrame
+        index_bytes = sum(positions.nbytes for positions in self._by_query.values()) + self.rollup.nbytes()
+        index_bytes += int(self.alerts.memory_usage(deep=True).sum())
+        return int(self.df.memory_usage(deep=True).sum()) + index_bytes
+
+    # Positions des lignes d'une Search Query, triées par date
+    def positions(self, query):
+        return self._by_query.get(query, np.empty(0, dtype='int64'))
+
+    # Positions des lignes des queries choisies (toutes si la liste est vide),
+    # query par query, dont la Reporting Date est dans [start, end]
+    def select(self, queries=None, start=None, end=None):
+        if queries:
+            positions = np.concatenate([self.positions(query) for query in dict.fromkeys(queries)])
+        else:
+            positions = np.arange(len(self.df))
+        if start is not None:
+            positions = positions[self._dates[positions] >= pd.Timestamp(start).value]
+        if end is not None:
+            # NaT est stocké comme le plus petit int64 : exclure ces lignes dès qu'une borne est donnée
+            positions = positions[(self._dates[positions] <= pd.Timestamp(end).value)
+                                  & (self._dates[positions] != np.iinfo('int64').min)]
+        return positions
+
+    # Lignes `positions`, float32 élargis comme avec widen. Lues colonne par
+    # colonne sur les tableaux du DataFrame complet (gardés en cache par pandas) :
+    # iloc puis widen recréaient chaque colonne deux fois, ce qui coûtait plus
+    # que la recherche des lignes
+    def take(self, positions):
+        columns = {}
+        for col, dtype in self.df.dtypes.items():
+            if isinstance(dtype, pd.CategoricalDtype):
+                columns[col] = self.df[col].array.take(positions)
+            else:
+                values = self.df[col].to_numpy()[positions]
+                columns[col] = widen_values(values) if dtype == 'float32' else values
+        return pd.DataFrame(columns, index=self.df.index[positions], copy=False)
+
+    # Série temporelle d'une Search Query (lignes triées par date)
+    def series(self, query):
+        return self.take(self.positions(query))
+
+    # Position de la ligne (query, date en ns) ou None si elle n'existe pas
+    def _position(self, query, date_value):
+        positions = self.positions(query)
+        if len(positions) == 0:
+            return None
+        query_dates = self._dates[positions]
+        i = np.searchsorted(query_dates, date_value)
+        if i == len(positions) or query_dates[i] != date_value:
+            return None
+        return positions[i]
+
+    # Positions des lignes (query, date en ns) déjà présentes, -1 pour les absentes.
+    # Comme _position, la première ligne importée est retenue pour un doublon.
+    # Recherche vectorisée : chaque (query, date) devient une clé entière
+    # (code de la query x rang de la date), cherchée par searchsorted
+    def _find_positions(self, queries, date_values):
+        current = self.df['Search Query']
+        codes = current.cat.codes.to_numpy().astype('int64')
+        new_codes = current.cat.categories.get_indexer(np.asarray(queries, dtype=object)).astype('int64')
+
+        date_ranks = np.unique(np.concatenate([self._dates, date_values]), return_inverse=True)[1]
+        n_dates = int(date_ranks.max()) + 1 if len(date_ranks) else 1
+        keys = codes * n_dates + date_ranks[:len(codes)]
+        new_keys = new_codes * n_dates + date_ranks[len(codes):]
+
+        rows = np.flatnonzero(codes >= 0)
+        rows = rows[np.argsort(keys[rows], kind='stable')]
+        if len(rows) == 0:
+            return np.full(len(new_keys), -1, dtype='int64')
+        sorted_keys = keys[rows]
+        i = np.minimum(np.searchsorted(sorted_keys, new_keys), len(rows) - 1)
+        found = (new_codes >= 0) & (sorted_keys[i] == new_keys)
+        return np.where(found, rows[i], -1)
+
+    # Ligne (query, date) ou None si elle n'existe pas
+    def row(self, query, date):
+        date = pd.Timestamp(date)
+        if pd.isna(date):
+            return None
+        position = self._position(query, date.value)
+        if position is None:
+            return None
+        return self.take([position]).iloc[0]
+
+    # Nouveau Dataset avec les lignes de new_df ajoutées, dédoublonnées sur
+    # (Search Query, Reporting Date) : une ligne déjà présente est remplacée par
+    # la nouvelle version. Le Dataset courant n'est pas modifié.
+    def append(self, new_df):
+        new_df = new_df.drop_duplicates(['Search Query', 'Reporting Date'], keep='last')
+        new_df = compact(new_df[new_df['Search Query'].notna()])
+        new_dates = new_df['Reporting Date'].to_numpy(dtype='datetime64[ns]').view('int64')
+
+        existing = self._find_positions(new_df['Search Query'], new_dates)
+        replaced = existing >= 0
+        current, added = _union_categories(self.df, new_df[~replaced])
+
+        combined = pd.concat([current, added], ignore_index=True)
+        if replaced.any():
+            replaced_positions = existing[replaced]
+            for col in new_df.columns:
+                values = new_df.loc[replaced, col]
+                # Élargir la colonne si les nouvelles valeurs ne tiennent pas dans son type réduit
+                if combined[col].dtype.kind in 'iuf' and values.dtype.kind in 'iuf':
+                    dtype = np.result_type(combined[col].dtype, values.dtype)
+                    if dtype != combined[col].dtype:
+                        combined[col] = combined[col].astype(dtype)
+                combined.loc[replaced_positions, col] = values.to_numpy()
+
+        dataset = Dataset.__new__(Dataset)
+        dataset.df = combined
+        # Les lignes remplacées gardent leur date : vue sur la colonne, comme dans _build_index
+        dataset._dates = combined['Reporting Date'].to_numpy(dtype='datetime64[ns]').view('int64')
+        dataset._by_query = dict(self._by_query)
+        dataset.queries = list(self.queries)
+
+        # Les lignes remplacées gardent leur position et leur date : seules les
+        # lignes ajoutées modifient l'index, Search Query par Search Query
+        added_positions = np.arange(len(self.df), len(combined))
+        codes, uniques = pd.factorize(added['Search Query'], sort=False)
+        order = np.argsort(codes, kind='stable')
+        groups = np.split(added_positions[order], np.flatnonzero(np.diff(codes[order])) + 1)
+        for query, positions in zip(uniques, groups):
+            if query in dataset._by_query:
+                positions = np.concatenate([dataset._by_query[query], positions])
+            else:
+                dataset.queries.append(query)
+            dataset._by_query[query] = positions[np.argsort(dataset._dates[positions], kind='stable')]
+
+        # Les lignes remplacées peuvent toucher toutes les périodes, tous les
+        # classements et toutes les fenêtres : cube, index de recherche et
+        # alertes recalculés
+        dataset._build_search()
+        dataset.rollup = RollupCube(combined)
+        dataset._build_alerts()
+        return dataset
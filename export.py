@@ -0,0 +1,127 @@
+# Export en flux du jeu de données enrichi (KPIs, Δ et stratégie) d'une session.
+#
+# Les lignes sont lues par tranches de EXPORT_CHUNK_ROWS et chaque tranche est
+# encodée puis envoyée aussitôt : ni le fichier complet ni une copie du jeu de
+# données ne sont construits en mémoire, quelle que soit la taille de l'export.
+#   - csv     : en-tête puis une tranche de texte par bloc de lignes (écrite par
+#               pyarrow s'il est installé, plusieurs fois plus rapide que pandas),
+#   - parquet : un row group par bloc (nécessite pyarrow),
+#   - arrow   : format de flux Arrow IPC, un record batch par bloc (nécessite pyarrow).
+#
+# Les valeurs exportées sont les valeurs exactes du jeu de données (KPIs non
+# arrondis, float32 élargis par widen). Le schéma Parquet / Arrow ne dépend pas
+# des types compacts, choisis d'après les valeurs de chaque import : entiers en
+# int64, flottants en float64, catégories en dictionary<int32, string>, texte en
+# string et dates en timestamp[ns].
+import pandas as pd
+
+from dataset import widen
+
+DATE_COLUMNS = ['Reporting Date']
+
+EXPORT_CHUNK_ROWS = 50000
+
+# Format -> (type MIME, extension du fichier téléchargé)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+
+
+# Fichier en écriture dont le contenu est repris (et vidé) après chaque tranche
+class _ChunkSink:
+    def __init__(self):
+        self._parts = []
+        self.closed = False
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+# Tranches de lignes, float32 repassés en float64 par leurs valeurs décimales
+def _chunks(df, positions, chunk_rows):
+    for start in range(0, len(positions), chunk_rows):
+        yield widen(df.iloc[positions[start: start + chunk_rows]])
+
+
+# Schéma Arrow fixe des colonnes de df (voir l'en-tête)
+def export_schema(df):
+    import pyarrow as pa
+
+    fields = []
+    for col, dtype in df.dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            arrow_type = pa.dictionary(pa.int32(), pa.string())
+        elif pd.api.types.is_bool_dtype(dtype):
+            arrow_type = pa.bool_()
+        elif pd.api.types.is_integer_dtype(dtype):
+            arrow_type = pa.int64()
+        elif pd.api.types.is_float_dtype(dtype):
+            arrow_type = pa.float64()
+        elif pd.api.types.is_datetime64_any_dtype(dtype):
+            arrow_type = pa.timestamp('ns')
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(col, arrow_type))
+    return pa.schema(fields)
+
+
+def _csv_chunks(df, positions, chunk_rows):
+    yield df.iloc[:0].to_csv(index=False).encode('utf-8')
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.csv as pa_csv
+    except ImportError:
+        for chunk in _chunks(df, positions, chunk_rows):
+            yield chunk.to_csv(header=False, index=False, date_format='%Y-%m-%d').encode('utf-8')
+        return
+
+    options = pa_csv.WriteOptions(include_header=False)
+    for chunk in _chunks(df, positions, chunk_rows):
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        for col in DATE_COLUMNS:
+            if col in table.column_names:
+                i = table.column_names.index(col)
+                table = table.set_column(i, col, pc.cast(table[col], pa.date32()))
+        sink = pa.BufferOutputStream()
+        pa_csv.write_csv(table, sink, options)
+        yield sink.getvalue().to_pybytes()
+
+
+def _arrow_chunks(df, positions, chunk_rows, fmt):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _ChunkSink()
+    schema = export_schema(df)
+    if fmt == 'parquet':
+        writer = pq.ParquetWriter(sink, schema)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+
+    for chunk in _chunks(df, positions, chunk_rows):
+        writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+# Octets du fichier exporté, tranche par tranche, pour les lignes `positions` de df
+def export_chunks(df, positions, fmt, chunk_rows=EXPORT_CHUNK_ROWS):
+    if fmt == 'csv':
+        return _csv_chunks(df, positions, chunk_rows)
+    return _arrow_chunks(df, positions, chunk_rows, fmt)
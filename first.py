@@ -1,136 +1,73 @@
 import dash
-from dash import dcc, html, Input, Output, State
+from dash import dcc, html, dash_table, Input, Output, State, ALL, ClientsideFunction
+from dash.dash_table import FormatTemplate
 import dash_bootstrap_components as dbc
 import pandas as pd
-import io
-import base64
 import plotly.graph_objects as go
+from urllib.parse import urlencode
+from flask import Response, abort, request
+from data_store import store_from_env
+from dataset import DISPLAY_DECIMALS, Dataset, for_display
+from export import EXPORT_FORMATS, export_chunks
+from ingest import ingest_many
+from jobs import background_manager_from_env
+import metrics
+from raw_table import table_page
+from render_cache import render_cache_from_env
+from report_cache import get_report_cache
+from rollup import COUNT_COLUMNS, period_labels
+from trends import ALERT_COLUMNS, TREND_WINDOW, Z_THRESHOLD
 #import webbrowser
 #from time import sleep
 
 # Créer l'application Dash avec un thème Bootstrap
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP], suppress_callback_exceptions=True)
 server = app.server
+# Taille des réponses des callbacks, relevée sur le corps HTTP envoyé par Dash
+metrics.install_response_size(server)
 
-# Définir une fonction pour déterminer la stratégie
-def define_strategy(row):
-    if row['Δ_CTR'] > 0 and row['Δ_CVR'] < 0:
-        return "Improve CVR"
-    elif row['Δ_CVR'] > 0 and row['Δ_CTR'] < 0:
-        return "Improve CTR"
-    elif row['Δ_CTR'] > 0 and row['Δ_CVR'] > 0:
-        return "Improve Traffic"
-    else:
-        return "Reduce Traffic"
-    
-def open_browser():
-    webbrowser.open_new("http://127.0.0.1:8050/")
-
-app.layout = dbc.Container([
-    dcc.Tabs([
-        dcc.Tab(label="Import Data", children=[
-            html.H2("Raw data arranged by query score"),
-            dcc.Upload(
-                id='upload-data',
-                children=dbc.Button('Import Data', color='primary'),
-                multiple=True
-            ),
-            html.Div(id='output-data-upload'),
-        ]),
-        dcc.Tab(label="Focus on a Keyword", children=[
-            html.H2("Focus on a Keyword"),
-            dcc.Dropdown(id='query-dropdown', options=[], placeholder="Choisissez une Search Query"),
-            dcc.Dropdown(id='date-dropdown', options=[], placeholder="Choisissez une Reporting Date", style={'margin-top': '20px', 'margin-bottom': '20px'}),
-            html.Div(id='kpi-display', style={'display': 'flex', 'justify-content': 'space-around', 'margin-bottom': '20px'}),
-            dcc.Graph(id='funnel-chart'),
-            html.Div(id='clicks_kpi', style={'display': 'flex', 'justify-content': 'flex-start', 'margin-bottom': '20px'}),
-            html.Div(id='kpi_section'),
-            dcc.Graph(id='delta-chart')
-        ])
-    ]),
-    dcc.Store(id='stored-data')
-], fluid=True)
-
-# Callback pour traiter les fichiers téléchargés et stocker les données dans dcc.Store
-@app.callback(
-    [Output('output-data-upload', 'children'),
-     Output('stored-data', 'data'),
-     Output('query-dropdown', 'options'),
-     Output('date-dropdown', 'options')],
-    Input('upload-data', 'contents')
-)
-def update_table(contents):
-    if contents is None:
-        return None, None, [], []
-
-    dfs = []  # Liste pour stocker les DataFrames lus à partir de chaque fichier
-
-    for content in contents:
-        # Lire le contenu de chaque fichier téléchargé
-        content_type, content_string = content.split(',')
-        decoded = base64.b64decode(content_string)
-        df = pd.read_csv(io.StringIO(decoded.decode('utf-8')), skiprows=1)
-
-        # Convertir la colonne "Reporting Date" en datetime
-        df['Reporting Date'] = pd.to_datetime(df['Reporting Date'], errors='coerce')
-
-        dfs.append(df)  # Ajouter le DataFrame à la liste
-
-    # Concaténer tous les DataFrames en un seul (hypothèse: même colonnes dans chaque fichier)
-    combined_df = pd.concat(dfs, ignore_index=True)
+# Les DataFrames restent côté serveur ; dcc.Store ne contient que leur clé
+dataset_store = store_from_env()
 
-    # Calculer les variables supplémentaires sur le DataFrame combiné
-    combined_df['Market_CTR'] = combined_df["Clicks: Total Count"] / combined_df["Impressions: Total Count"] 
-    combined_df["Brand_CTR"] = combined_df["Clicks: Brand Count"] / combined_df["Impressions: Brand Count"]  
-    combined_df["Δ_CTR"] = combined_df["Brand_CTR"] - combined_df["Market_CTR"]
+# Les uploads sont importés dans un processus de fond, avec progression et annulation
+# (None : import synchrone dans le callback)
+background_manager = background_manager_from_env(dataset_store)
 
-    combined_df['Market_CVR'] = combined_df["Purchases: Total Count"] / combined_df["Clicks: Total Count"] 
-    combined_df["Brand_CVR"] = combined_df["Purchases: Brand Count"] / combined_df["Clicks: Brand Count"] 
-    combined_df["Δ_CVR"] = combined_df["Brand_CVR"] - combined_df["Market_CVR"]
+# Bundles de l'onglet "Focus on a Keyword" mémorisés par (jeu de données, query)
+render_cache = render_cache_from_env()
 
-    combined_df['strategy'] = combined_df.apply(define_strategy, axis=1)
-    combined_df = combined_df.round(1)
+# Compteurs des caches, lus au moment de l'export /metrics
+metrics.registry.register_collector('amazonkpi_render_cache_hits_total', lambda: render_cache.hits,
+                                    "Focus on a Keyword bundles served from the cache")
+metrics.registry.register_collector('amazonkpi_render_cache_misses_total', lambda: render_cache.misses,
+                                    "Focus on a Keyword bundles computed")
 
-    # Convertir le dataframe combiné en table HTML stylisée avec Bootstrap
-    table = dbc.Table.from_dataframe(combined_df, striped=True, bordered=True, hover=True, dark=True)
+RAW_TABLE_PAGE_SIZE = 25
 
-    # Mettre à jour les options du dropdown pour la Search Query
-    dropdown_options = [{'label': query, 'value': query} for query in combined_df['Search Query'].unique()]
+# Nombre maximal de queries proposées par les dropdowns à chaque saisie
+QUERY_OPTIONS_LIMIT = 50
 
-    # Mettre à jour les options du dropdown pour les dates
-    date_options = [{'label': date.strftime('%Y-%m-%d'), 'value': date.strftime('%Y-%m-%d')} for date in combined_df['Reporting Date'].unique()]
+# Barre de progression d'un fichier selon son état dans ingest_many : (valeur, couleur)
+FILE_PROGRESS = {
+    'queued': (0, 'secondary'),
+    'parsing': (50, 'info'),
+    'cached': (100, 'success'),
+    'done': (100, 'success'),
+    'failed': (100, 'danger'),
+}
 
-    # Stocker le dataframe combiné sous forme de dictionnaire
-    return table, combined_df.to_dict('records'), dropdown_options, date_options
-
-
-# Callback pour mettre à jour les KPIs, le graphique et les statistiques sur les clics
-@app.callback(
-    [Output('kpi-display', 'children'),
-     Output('funnel-chart', 'figure'),
-     Output('kpi_section', 'children'),
-     Output('delta-chart', 'figure')],
-    [Input('query-dropdown', 'value'),
-     Input('date-dropdown', 'value'),
-     Input('stored-data', 'data')]
-)
-def update_kpi_funnel(selected_query, selected_date, data):
-    if selected_query is None or selected_date is None or data is None:
-        return None, go.Figure(), None, go.Figure()
-
-    df = pd.DataFrame(data)
-
-    # Filtrer les données en fonction de la Search Query sélectionnée et de la date
-    df['Reporting Date'] = pd.to_datetime(df['Reporting Date'], errors='coerce')
-    filtered_df = df[(df['Search Query'] == selected_query) & (df['Reporting Date'] == pd.to_datetime(selected_date))]
-    df_graph = df[(df['Search Query'] == selected_query)]
+def open_browser():
+    webbrowser.open_new("http://127.0.0.1:8050/")
 
-    # Si le DataFrame filtré est vide, retourner une valeur par défaut
-    if filtered_df.empty:
-        return None, go.Figure(), None, go.Figure()
+# Identifiant d'une valeur des cartes KPI : un seul callback (pattern-matching)
+# met à jour toutes les valeurs sans renvoyer les cartes
+def kpi_id(field):
+    return {'type': 'kpi-value', 'field': field}
 
-    filtered_df = filtered_df.iloc[0]
 
+# Squelette des cartes KPI de l'onglet "Focus on a Keyword", construit une seule
+# fois dans app.layout ; l'ordre des valeurs est celui de KPI_FIELDS
+def kpi_skeleton():
     # Définir les KPIs avec les icônes et le style modifié
     kpi_layout = [
         html.Div([
@@ -138,18 +75,18 @@ def update_kpi_funnel(selected_query, selected_date, data):
             html.P("📊", style={'font-size': '32px', 'text-align': 'center'}),
             html.Div([
                 html.P("Total", style={'font-size': '16px', 'color': 'blue', 'text-align': 'center'}),
-                html.P(f"{filtered_df['Impressions: Total Count']:,}", style={
+                html.P(id=kpi_id('impressions-total'), style={
                     'font-size': '24px', 'color': 'blue', 'text-align': 'center',
                     'border': '2px solid blue', 'padding': '10px', 'border-radius': '5px'}),
             ]),
             html.Div([
                 html.P("Brand", style={'font-size': '16px', 'color': 'green', 'text-align': 'center'}),
-                html.P(f"{filtered_df['Impressions: Brand Count']:,}", style={
+                html.P(id=kpi_id('impressions-brand'), style={
                     'font-size': '24px', 'color': 'green', 'text-align': 'center',
                     'border': '2px solid green', 'padding': '10px', 'border-radius': '5px'}),
             ]),
             html.Div([
-                html.P(f"{filtered_df['Impressions: Brand Share %']:,}"+" %", style={
+                html.P(id=kpi_id('impressions-share'), style={
                     'font-size': '24px', 'color': 'green', 'text-align': 'center',
                     'border': '2px solid green', 'padding': '10px', 'border-radius': '5px'}),
             ])
@@ -160,18 +97,18 @@ def update_kpi_funnel(selected_query, selected_date, data):
             html.P("👆", style={'font-size': '32px', 'text-align': 'center'}),
             html.Div([
                 html.P("Total", style={'font-size': '16px', 'color': 'blue', 'text-align': 'center'}),
-                html.P(f"{filtered_df['Clicks: Total Count']:,}", style={
+                html.P(id=kpi_id('clicks-total'), style={
                     'font-size': '24px', 'color': 'blue', 'text-align': 'center',
                     'border': '2px solid blue', 'padding': '10px', 'border-radius': '5px'}),
             ]),
             html.Div([
                 html.P("Brand", style={'font-size': '16px', 'color': 'green', 'text-align': 'center'}),
-                html.P(f"{filtered_df['Clicks: Brand Count']:,}", style={
+                html.P(id=kpi_id('clicks-brand'), style={
                     'font-size': '24px', 'color': 'green', 'text-align': 'center',
                     'border': '2px solid green', 'padding': '10px', 'border-radius': '5px'}),
             ]),
             html.Div([
-                html.P(f"{filtered_df['Clicks: Brand Share %']:,}"+" %", style={
+                html.P(id=kpi_id('clicks-share'), style={
                     'font-size': '24px', 'color': 'green', 'text-align': 'center',
                     'border': '2px solid green', 'padding': '10px', 'border-radius': '5px'}),
             ])
@@ -183,18 +120,18 @@ def update_kpi_funnel(selected_query, selected_date, data):
             html.P("🛒", style={'font-size': '32px', 'text-align': 'center'}),
             html.Div([
                 html.P("Total", style={'font-size': '16px', 'color': 'blue', 'text-align': 'center'}),
-                html.P(f"{filtered_df['Basket Adds: Total Count']:,}", style={
+                html.P(id=kpi_id('basket-total'), style={
                     'font-size': '24px', 'color': 'blue', 'text-align': 'center',
                     'border': '2px solid blue', 'padding': '10px', 'border-radius': '5px'}),
             ]),
             html.Div([
                 html.P("Brand", style={'font-size': '16px', 'color': 'green', 'text-align': 'center'}),
-                html.P(f"{filtered_df['Basket Adds: Brand Count']:,}", style={
+                html.P(id=kpi_id('basket-brand'), style={
                     'font-size': '24px', 'color': 'green', 'text-align': 'center',
                     'border': '2px solid green', 'padding': '10px', 'border-radius': '5px'}),
             ]),
             html.Div([
-                html.P(f"{filtered_df['Basket Adds: Brand Share %']:,}"+" %", style={
+                html.P(id=kpi_id('basket-share'), style={
                     'font-size': '24px', 'color': 'green', 'text-align': 'center',
                     'border': '2px solid green', 'padding': '10px', 'border-radius': '5px'}),
             ])
@@ -206,18 +143,18 @@ def update_kpi_funnel(selected_query, selected_date, data):
             html.P("💳", style={'font-size': '32px', 'text-align': 'center'}),
             html.Div([
                 html.P("Total", style={'font-size': '16px', 'color': 'blue', 'text-align': 'center'}),
-                html.P(f"{filtered_df['Purchases: Total Count']:,}", style={
+                html.P(id=kpi_id('purchases-total'), style={
                     'font-size': '24px', 'color': 'blue', 'text-align': 'center',
                     'border': '2px solid blue', 'padding': '10px', 'border-radius': '5px'}),
             ]),
             html.Div([
                 html.P("Brand", style={'font-size': '16px', 'color': 'green', 'text-align': 'center'}),
-                html.P(f"{filtered_df['Purchases: Brand Count']:,}", style={
+                html.P(id=kpi_id('purchases-brand'), style={
                     'font-size': '24px', 'color': 'green', 'text-align': 'center',
                     'border': '2px solid green', 'padding': '10px', 'border-radius': '5px'}),
             ]),
             html.Div([
-                html.P(f"{filtered_df['Purchases: Brand Share %']:,}"+" %", style={
+                html.P(id=kpi_id('purchases-share'), style={
                     'font-size': '24px', 'color': 'green', 'text-align': 'center',
                     'border': '2px solid green', 'padding': '10px', 'border-radius': '5px'}),
             ])
@@ -225,19 +162,6 @@ def update_kpi_funnel(selected_query, selected_date, data):
         ], style={'display': 'inline-block', 'width': '24%', 'margin': '10px'}),
     ]
 
-    # Créer le funnel chart
-    funnel_chart = go.Figure()
-    funnel_chart.add_trace(go.Funnel(
-        y=["Impressions Brand", "Clicks", "Basket Adds", "Purchases"],
-        x=[
-            filtered_df["Impressions: Brand Share %"],
-            filtered_df["Clicks: Brand Share %"], 
-            filtered_df["Basket Adds: Brand Share %"], 
-            filtered_df["Purchases: Brand Share %"]],
-        textinfo="value"))
-
-    funnel_chart.update_traces(marker=dict(color=['blue', 'orange', 'green', 'red']))
-
     # Créer les statistiques sur les clics
     clicks_kpi = [
         html.Div([
@@ -246,13 +170,13 @@ def update_kpi_funnel(selected_query, selected_date, data):
                 html.P("👆", style={'font-size': '32px', 'text-align': 'left'}),
                 html.Div([
                     html.P("Total", style={'font-size': '16px', 'color': 'blue', 'text-align': 'left'}),
-                    html.P(f"{filtered_df['Clicks: Click Rate %']:.2f}%", style={
+                    html.P(id=kpi_id('clicks-rate'), style={
                         'font-size': '24px', 'color': 'blue', 'text-align': 'left',
                         'border': '2px solid blue', 'padding': '10px', 'border-radius': '5px'}),
                 ]),
                 html.Div([
                     html.P("Brand", style={'font-size': '16px', 'color': 'green', 'text-align': 'left'}),
-                    html.P(f"{filtered_df['Clicks: Brand Share %']:.2f}%", style={
+                    html.P(id=kpi_id('clicks-brand-rate'), style={
                         'font-size': '24px', 'color': 'green', 'text-align': 'left',
                         'border': '2px solid green', 'padding': '10px', 'border-radius': '5px'}),
                 ]),
@@ -265,19 +189,19 @@ def update_kpi_funnel(selected_query, selected_date, data):
                 html.P("💰", style={'font-size': '32px', 'text-align': 'left'}),
                 html.Div([
                     html.P("Total", style={'font-size': '16px', 'color': 'blue', 'text-align': 'left'}),
-                    html.P(f"{filtered_df['Clicks: Price (Median)']:,}", style={
+                    html.P(id=kpi_id('clicks-price'), style={
                         'font-size': '24px', 'color': 'blue', 'text-align': 'left',
                         'border': '2px solid blue', 'padding': '10px', 'border-radius': '5px'}),
                 ]),
                 html.Div([
                     html.P("Brand", style={'font-size': '16px', 'color': 'green', 'text-align': 'left'}),
-                    html.P(f"{filtered_df['Clicks: Brand Price (Median)']:,}", style={
+                    html.P(id=kpi_id('clicks-brand-price'), style={
                         'font-size': '24px', 'color': 'green', 'text-align': 'left',
                         'border': '2px solid green', 'padding': '10px', 'border-radius': '5px'}),
                 ]),
                 html.Div([
                     html.P("Difference", style={'font-size': '16px', 'color': 'red', 'text-align': 'left'}),
-                    html.P(f"{filtered_df['Clicks: Price (Median)'] - filtered_df['Clicks: Brand Price (Median)']:.2f}", style={
+                    html.P(id=kpi_id('clicks-price-diff'), style={
                         'font-size': '24px', 'color': 'red', 'text-align': 'left',
                         'border': '2px solid red', 'padding': '10px', 'border-radius': '5px'}),
                 ]),
@@ -288,19 +212,19 @@ def update_kpi_funnel(selected_query, selected_date, data):
                 html.P("🚚", style={'font-size': '32px', 'text-align': 'left'}),
                 html.Div([
                     html.P("Same-Day", style={'font-size': '16px', 'color': 'blue', 'text-align': 'left'}),
-                    html.P(f"{filtered_df['Clicks: Same-Day Shipping Speed']:,}", style={
+                    html.P(id=kpi_id('clicks-same-day'), style={
                         'font-size': '24px', 'color': 'blue', 'text-align': 'left',
                         'border': '2px solid blue', 'padding': '10px', 'border-radius': '5px'}),
                 ]),
                 html.Div([
                     html.P("1D Shipping", style={'font-size': '16px', 'color': 'orange', 'text-align': 'left'}),
-                    html.P(f"{filtered_df['Clicks: 1D-Shipping Speed']:,}", style={
+                    html.P(id=kpi_id('clicks-1d'), style={
                         'font-size': '24px', 'color': 'orange', 'text-align': 'left',
                         'border': '2px solid orange', 'padding': '10px', 'border-radius': '5px'}),
                 ]),
                 html.Div([
                     html.P("2D Shipping", style={'font-size': '16px', 'color': 'green', 'text-align': 'left'}),
-                    html.P(f"{filtered_df['Clicks: 2D-Shipping Speed']:,}", style={
+                    html.P(id=kpi_id('clicks-2d'), style={
                         'font-size': '24px', 'color': 'green', 'text-align': 'left',
                         'border': '2px solid green', 'padding': '10px', 'border-radius': '5px'}),
                 ]),
@@ -316,13 +240,13 @@ def update_kpi_funnel(selected_query, selected_date, data):
                 html.P("🛒", style={'font-size': '32px', 'text-align': 'left'}),
                 html.Div([
                     html.P("Total", style={'font-size': '16px', 'color': 'blue', 'text-align': 'left'}),
-                    html.P(f"{filtered_df['Basket Adds: Basket Add Rate %']:.2f}%", style={
+                    html.P(id=kpi_id('basket-rate'), style={
                         'font-size': '24px', 'color': 'blue', 'text-align': 'left',
                         'border': '2px solid blue', 'padding': '10px', 'border-radius': '5px'}),
                 ]),
                 html.Div([
                     html.P("Brand", style={'font-size': '16px', 'color': 'green', 'text-align': 'left'}),
-                    html.P(f"{filtered_df['Basket Adds: Brand Share %']:.2f}%", style={
+                    html.P(id=kpi_id('basket-brand-rate'), style={
                         'font-size': '24px', 'color': 'green', 'text-align': 'left',
                         'border': '2px solid green', 'padding': '10px', 'border-radius': '5px'}),
                 ]),
@@ -334,19 +258,19 @@ def update_kpi_funnel(selected_query, selected_date, data):
                 html.P("💰", style={'font-size': '32px', 'text-align': 'left'}),
                 html.Div([
                     html.P("Total", style={'font-size': '16px', 'color': 'blue', 'text-align': 'left'}),
-                    html.P(f"{filtered_df['Basket Adds: Price (Median)']:.2f}", style={
+                    html.P(id=kpi_id('basket-price'), style={
                         'font-size': '24px', 'color': 'blue', 'text-align': 'left',
                         'border': '2px solid blue', 'padding': '10px', 'border-radius': '5px'}),
                 ]),
                 html.Div([
                     html.P("Brand", style={'font-size': '16px', 'color': 'green', 'text-align': 'left'}),
-                    html.P(f"{filtered_df['Basket Adds: Brand Price (Median)']:.2f}", style={
+                    html.P(id=kpi_id('basket-brand-price'), style={
                         'font-size': '24px', 'color': 'green', 'text-align': 'left',
                         'border': '2px solid green', 'padding': '10px', 'border-radius': '5px'}),
                 ]),
                 html.Div([
                     html.P("Difference", style={'font-size': '16px', 'color': 'red', 'text-align': 'left'}),
-                    html.P(f"{filtered_df['Basket Adds: Price (Median)'] - filtered_df['Basket Adds: Brand Price (Median)']:.2f}", style={
+                    html.P(id=kpi_id('basket-price-diff'), style={
                         'font-size': '24px', 'color': 'red', 'text-align': 'left',
                         'border': '2px solid red', 'padding': '10px', 'border-radius': '5px'}),
                 ])
@@ -357,19 +281,19 @@ def update_kpi_funnel(selected_query, selected_date, data):
                 html.P("🚚", style={'font-size': '32px', 'text-align': 'left'}),
                 html.Div([
                     html.P("Same-Day", style={'font-size': '16px', 'color': 'blue', 'text-align': 'left'}),
-                    html.P(f"{filtered_df['Basket Adds: Same-Day Shipping Speed']:,}", style={
+                    html.P(id=kpi_id('basket-same-day'), style={
                         'font-size': '24px', 'color': 'blue', 'text-align': 'left',
                         'border': '2px solid blue', 'padding': '10px', 'border-radius': '5px'}),
                 ]),
                 html.Div([
                     html.P("1D Shipping", style={'font-size': '16px', 'color': 'orange', 'text-align': 'left'}),
-                    html.P(f"{filtered_df['Basket Adds: 1D-Shipping Speed']:,}", style={
+                    html.P(id=kpi_id('basket-1d'), style={
                         'font-size': '24px', 'color': 'orange', 'text-align': 'left',
                         'border': '2px solid orange', 'padding': '10px', 'border-radius': '5px'}),
                 ]),
                 html.Div([
                     html.P("2D Shipping", style={'font-size': '16px', 'color': 'green', 'text-align': 'left'}),
-                    html.P(f"{filtered_df['Basket Adds: 2D-Shipping Speed']:,}", style={
+                    html.P(id=kpi_id('basket-2d'), style={
                         'font-size': '24px', 'color': 'green', 'text-align': 'left',
                         'border': '2px solid green', 'padding': '10px', 'border-radius': '5px'}),
                 ]),
@@ -385,13 +309,13 @@ def update_kpi_funnel(selected_query, selected_date, data):
                 html.P("💳", style={'font-size': '32px', 'text-align': 'left'}),
                 html.Div([
                     html.P("Total", style={'font-size': '16px', 'color': 'blue', 'text-align': 'left'}),
-                    html.P(f"{filtered_df['Purchases: Purchase Rate %']:.2f}%", style={
+                    html.P(id=kpi_id('purchases-rate'), style={
                         'font-size': '24px', 'color': 'blue', 'text-align': 'left',
                         'border': '2px solid blue', 'padding': '10px', 'border-radius': '5px'}),
                 ]),
                 html.Div([
                     html.P("Brand", style={'font-size': '16px', 'color': 'green', 'text-align': 'left'}),
-                    html.P(f"{filtered_df['Purchases: Brand Share %']:.2f}%", style={
+                    html.P(id=kpi_id('purchases-brand-rate'), style={
                         'font-size': '24px', 'color': 'green', 'text-align': 'left',
                         'border': '2px solid green', 'padding': '10px', 'border-radius': '5px'}),
                 ]),
@@ -402,19 +326,19 @@ def update_kpi_funnel(selected_query, selected_date, data):
                 html.P("💰", style={'font-size': '32px', 'text-align': 'left'}),
                 html.Div([
                     html.P("Total", style={'font-size': '16px', 'color': 'blue', 'text-align': 'left'}),
-                    html.P(f"{filtered_df['Purchases: Price (Median)']:.2f}", style={
+                    html.P(id=kpi_id('purchases-price'), style={
                         'font-size': '24px', 'color': 'blue', 'text-align': 'left',
                         'border': '2px solid blue', 'padding': '10px', 'border-radius': '5px'}),
                 ]),
                 html.Div([
                     html.P("Brand", style={'font-size': '16px', 'color': 'green', 'text-align': 'left'}),
-                    html.P(f"{filtered_df['Purchases: Brand Price (Median)']:.2f}", style={
+                    html.P(id=kpi_id('purchases-brand-price'), style={
                         'font-size': '24px', 'color': 'green', 'text-align': 'left',
                         'border': '2px solid green', 'padding': '10px', 'border-radius': '5px'}),
                 ]),
                 html.Div([
                     html.P("Difference", style={'font-size': '16px', 'color': 'red', 'text-align': 'left'}),
-                    html.P(f"{filtered_df['Purchases: Price (Median)'] - filtered_df['Purchases: Brand Price (Median)']:.2f}", style={
+                    html.P(id=kpi_id('purchases-price-diff'), style={
                         'font-size': '24px', 'color': 'red', 'text-align': 'left',
                         'border': '2px solid red', 'padding': '10px', 'border-radius': '5px'}),
                 ])
@@ -425,19 +349,19 @@ def update_kpi_funnel(selected_query, selected_date, data):
                 html.P("🚚", style={'font-size': '32px', 'text-align': 'left'}),
                 html.Div([
                     html.P("Same-Day", style={'font-size': '16px', 'color': 'blue', 'text-align': 'left'}),
-                    html.P(f"{filtered_df['Purchases: Same-Day Shipping Speed']:,}", style={
+                    html.P(id=kpi_id('purchases-same-day'), style={
                         'font-size': '24px', 'color': 'blue', 'text-align': 'left',
                         'border': '2px solid blue', 'padding': '10px', 'border-radius': '5px'}),
                 ]),
                 html.Div([
                     html.P("1D Shipping", style={'font-size': '16px', 'color': 'orange', 'text-align': 'left'}),
-                    html.P(f"{filtered_df['Purchases: 1D-Shipping Speed']:,}", style={
+                    html.P(id=kpi_id('purchases-1d'), style={
                         'font-size': '24px', 'color': 'orange', 'text-align': 'left',
                         'border': '2px solid orange', 'padding': '10px', 'border-radius': '5px'}),
                 ]),
                 html.Div([
                     html.P("2D Shipping", style={'font-size': '16px', 'color': 'green', 'text-align': 'left'}),
-                    html.P(f"{filtered_df['Purchases: 2D-Shipping Speed']:,}", style={
+                    html.P(id=kpi_id('purchases-2d'), style={
                         'font-size': '24px', 'color': 'green', 'text-align': 'left',
                         'border': '2px solid green', 'padding': '10px', 'border-radius': '5px'}),
                 ]),
@@ -462,21 +386,51 @@ def update_kpi_funnel(selected_query, selected_date, data):
             html.Div(purchases_kpi, style={'width': '100%'})  
         ], style={'width': '33%', 'padding': '10px'}),
     ], style={'display': 'flex', 'justify-content': 'space-between', 'align-items': 'stretch', 'margin': '10px'})
-    
-    # Créer le graphique pour Δ_CTR et Δ_CVR en fonction de Reporting Date
+    return kpi_layout, kpi_section
+
+
+# Champs des cartes KPI, dans l'ordre où ils apparaissent dans le squelette
+KPI_FIELDS = [
+    'impressions-total', 'impressions-brand', 'impressions-share',
+    'clicks-total', 'clicks-brand', 'clicks-share',
+    'basket-total', 'basket-brand', 'basket-share',
+    'purchases-total', 'purchases-brand', 'purchases-share',
+    'clicks-rate', 'clicks-brand-rate', 'clicks-price', 'clicks-brand-price', 'clicks-price-diff',
+    'clicks-same-day', 'clicks-1d', 'clicks-2d',
+    'basket-rate', 'basket-brand-rate', 'basket-price', 'basket-brand-price', 'basket-price-diff',
+    'basket-same-day', 'basket-1d', 'basket-2d',
+    'purchases-rate', 'purchases-brand-rate', 'purchases-price', 'purchases-brand-price', 'purchases-price-diff',
+    'purchases-same-day', 'purchases-1d', 'purchases-2d',
+]
+
+
+# Funnel vide : les valeurs x sont remplies dans le navigateur (assets/focus.js)
+def funnel_figure():
+    funnel_chart = go.Figure()
+    funnel_chart.add_trace(go.Funnel(
+        y=["Impressions Brand", "Clicks", "Basket Adds", "Purchases"],
+        x=[],
+        textinfo="value"))
+
+    funnel_chart.update_traces(marker=dict(color=['blue', 'orange', 'green', 'red']))
+    return funnel_chart.to_dict()
+
+
+# Graphique des Δ vide : les séries sont remplies dans le navigateur (assets/focus.js)
+def delta_figure():
     delta_chart = go.Figure()
 
     delta_chart.add_trace(go.Scatter(
-       x=df_graph['Reporting Date'],
-       y=df_graph['Δ_CTR'],
+       x=[],
+       y=[],
        mode='lines+markers',
        name='Δ_CTR',
        line=dict(color='blue')
        ))
 
     delta_chart.add_trace(go.Scatter(
-       x=df_graph['Reporting Date'],
-       y=df_graph['Δ_CVR'],
+       x=[],
+       y=[],
        mode='lines+markers',
        name='Δ_CVR',
        line=dict(color='green')
@@ -490,8 +444,660 @@ def update_kpi_funnel(selected_query, selected_date, data):
        margin=dict(l=0, r=0, t=30, b=0),
        height=400
    )
+    return delta_chart.to_dict()
+
+
+kpi_layout, kpi_section = kpi_skeleton()
+
+app.layout = dbc.Container([
+    dcc.Tabs([
+        dcc.Tab(label="Import Data", children=[
+            html.H2("Raw data arranged by query score"),
+            dcc.Upload(
+                id='upload-data',
+                children=dbc.Button('Import Data', color='primary'),
+                multiple=True
+            ),
+            dbc.Switch(id='append-mode', label="Append to the current data (new weeks)", value=False,
+                       style={'margin-top': '10px'}),
+            html.Div([
+                dbc.Progress(id='upload-progress', value=0, striped=True, animated=True, style={'height': '24px'}),
+                html.Div(id='upload-files-progress', style={'margin-top': '10px'}),
+                dbc.Button("Cancel", id='cancel-upload', color='secondary', size='sm', disabled=True),
+            ], id='upload-progress-container', style={'display': 'none'}),
+            html.Div(id='export-links', style={'margin-top': '10px', 'margin-bottom': '10px'}),
+            html.Div(id='output-data-upload'),
+        ]),
+        dcc.Tab(label="Focus on a Keyword", children=[
+            html.H2("Focus on a Keyword"),
+            dcc.Dropdown(id='query-dropdown', options=[], placeholder="Choisissez une Search Query (tapez pour chercher)"),
+            dcc.Dropdown(id='date-dropdown', options=[], placeholder="Choisissez une Reporting Date", style={'margin-top': '20px', 'margin-bottom': '20px'}),
+            html.Div(kpi_layout, id='kpi-display', style={'display': 'flex', 'justify-content': 'space-around', 'margin-bottom': '20px'}),
+            dcc.Graph(id='funnel-chart', figure=funnel_figure()),
+            html.Div(id='clicks_kpi', style={'display': 'flex', 'justify-content': 'flex-start', 'margin-bottom': '20px'}),
+            html.Div(kpi_section, id='kpi_section'),
+            dcc.Graph(id='delta-chart', figure=delta_figure()),
+            # Série complète de la query choisie : les changements de date sont
+            # rendus dans le navigateur (assets/focus.js)
+            dcc.Store(id='query-bundle')
+        ]),
+        dcc.Tab(label="Portfolio", children=[
+            html.H2("Portfolio"),
+            dcc.Dropdown(id='portfolio-queries', options=[], multi=True, placeholder="All queries"),
+            html.Div([
+                dbc.RadioItems(id='portfolio-grain', inline=True, value='month', options=[
+                    {'label': "Week", 'value': 'week'},
+                    {'label': "Month", 'value': 'month'},
+                    {'label': "Quarter", 'value': 'quarter'}]),
+                dcc.DatePickerRange(id='portfolio-dates', display_format='YYYY-MM-DD'),
+            ], style={'display': 'flex', 'align-items': 'center', 'gap': '20px', 'margin-top': '20px', 'margin-bottom': '20px'}),
+            html.Div(id='portfolio-summary', style={'display': 'flex', 'justify-content': 'space-around', 'margin-bottom': '20px'}),
+            dcc.Graph(id='portfolio-chart'),
+            html.Div(id='portfolio-table'),
+            html.A("Export the selected queries and dates (CSV)", id='portfolio-export', href=None,
+                   style={'display': 'inline-block', 'margin-top': '10px'})
+        ]),
+        dcc.Tab(label="Alerts", children=[
+            html.H2("Alerts"),
+            html.P(f"Strategy changes and Δ_CTR / Δ_CVR anomalies (|z-score| ≥ {Z_THRESHOLD:g} against the "
+                   f"previous {TREND_WINDOW} reports) at the latest report of each Search Query"),
+            html.Div(id='alerts-summary', style={'margin-bottom': '10px'}),
+            # Table paginée, triée et filtrée côté serveur, comme celle des données brutes
+            dash_table.DataTable(
+                id='alerts-table',
+                columns=[{'name': col, 'id': col} for col in ALERT_COLUMNS],
+                data=[],
+                page_current=0,
+                page_size=RAW_TABLE_PAGE_SIZE,
+                page_action='custom',
+                sort_action='custom',
+                sort_mode='multi',
+                sort_by=[],
+                filter_action='custom',
+                filter_query='',
+                style_table={'overflowX': 'auto'},
+                style_header={'backgroundColor': '#212529', 'color': 'white', 'fontWeight': 'bold'},
+                style_data={'backgroundColor': '#343a40', 'color': 'white'},
+                style_data_conditional=[{'if': {'row_index': 'odd'}, 'backgroundColor': '#2c3034'}],
+            )
+        ])
+    ]),
+    dcc.Store(id='stored-data'),
+    # Compte rendu du dernier import pour le processus web (voir record_upload)
+    dcc.Store(id='upload-report')
+], fluid=True)
+
+# Publier l'avancement de l'import (tâche de fond uniquement) : barre globale et
+# une barre par fichier
+def _upload_progress(set_progress, value, label, filenames=None, statuses=None):
+    if set_progress is None:
+        return
+    files = []
+    for filename, status in zip(filenames or [], statuses or []):
+        file_value, color = FILE_PROGRESS[status]
+        files.append(html.Div([
+            html.Span(filename, style={'display': 'inline-block', 'width': '40%'}),
+            dbc.Progress(value=file_value, label=status, color=color,
+                         style={'display': 'inline-flex', 'width': '55%', 'height': '16px'}),
+        ]))
+    set_progress((value, label, files))
+
+
+# Callback pour traiter les fichiers téléchargés et stocker les données dans dcc.Store
+# (enregistré plus bas, en tâche de fond si possible)
+@metrics.instrument('update_table')
+def update_table(contents, filenames, previous_key=None, append=False, set_progress=None):
+    if contents is None:
+        return None, None
+
+    # Lire les fichiers et calculer les CTR / CVR, les Δ et la stratégie en parallèle.
+    # Les fichiers déjà importés sont relus depuis le cache des rapports ; l'ordre des
+    # fichiers est conservé et un fichier invalide est signalé sans bloquer les autres
+    def file_progress(statuses):
+        finished = sum(status not in ('queued', 'parsing') for status in statuses)
+        _upload_progress(set_progress, 5 + 65 * finished // len(statuses),
+                         f"Reading files ({finished}/{len(statuses)})", filenames, statuses)
+
+    # Compteurs du cache des rapports avant l'import : ceux du processus qui
+    # importe (une tâche de fond repart de ceux du worker web)
+    report_cache = get_report_cache()
+    cache_before = report_cache.stats() if report_cache is not None else None
+
+    with metrics.stage('ingest'):
+        results, errors = ingest_many(contents, filenames, progress=file_progress)
+    alerts = [dbc.Alert(f"{filename} : {error}", color='danger') for filename, error in errors]
+    if not results:
+        # Aucun fichier lisible : le jeu de données de la session reste en place
+        return alerts, dash.no_update
+
+    dfs = [df for filename, df in results]
+
+    # Concaténer tous les DataFrames en un seul (hypothèse: même colonnes dans chaque fichier)
+    _upload_progress(set_progress, 75, "Merging reports")
+    with metrics.stage('concat'):
+        # Valeurs exactes : l'arrondi à DISPLAY_DECIMALS ne sert qu'à l'affichage
+        combined_df = pd.concat(dfs, ignore_index=True)
+    metrics.add_rows(len(combined_df))
+
+    # Mode ajout : fusionner les nouveaux rapports dans le jeu de données de la session.
+    # Seules les nouvelles lignes ont été lues et enrichies, et l'index est mis à jour
+    # sans être reconstruit ; une ligne (Search Query, Reporting Date) déjà présente
+    # est remplacée par sa nouvelle version
+    previous = dataset_store.get(previous_key) if append and previous_key is not None else None
+    if append and previous_key is not None and previous is None:
+        # Jeu de données expiré (ou supprimé) : prévenir que les semaines déjà
+        # importées ne font plus partie des données
+        alerts.append(dbc.Alert("The previous data has expired and could not be extended: only the files "
+                                "imported now are loaded. Import the earlier reports again to restore them.",
+                                color='warning'))
+    _upload_progress(set_progress, 80, "Indexing")
+    with metrics.stage('index'):
+        if previous is not None:
+            dataset = previous.append(combined_df)
+        else:
+            # Indexer le dataframe par (Search Query, Reporting Date) une fois pour toutes
+            dataset = Dataset(combined_df)
+
+    with metrics.stage('table_build'):
+        # Table paginée côté serveur : seule la page visible est calculée et envoyée
+        table = dash_table.DataTable(
+            id='raw-table',
+            columns=[{'name': col, 'id': col} for col in dataset.df.columns],
+            data=[],
+            page_current=0,
+            page_size=RAW_TABLE_PAGE_SIZE,
+            page_action='custom',
+            sort_action='custom',
+            sort_mode='multi',
+            sort_by=[],
+            filter_action='custom',
+            filter_query='',
+            style_table={'overflowX': 'auto'},
+            style_header={'backgroundColor': '#212529', 'color': 'white', 'fontWeight': 'bold'},
+            style_data={'backgroundColor': '#343a40', 'color': 'white'},
+            style_data_conditional=[{'if': {'row_index': 'odd'}, 'backgroundColor': '#2c3034'}],
+        )
+
+    # Stocker le jeu de données côté serveur et n'envoyer que sa clé au navigateur
+    _upload_progress(set_progress, 95, "Saving")
+    with metrics.stage('store'):
+        dataset_key = dataset_store.put(dataset)
+
+    # Empreinte mémoire de la session (DataFrame compact et index)
+    dataset_bytes = dataset.memory_usage()
+    metrics.registry.observe('amazonkpi_dataset_bytes', {}, dataset_bytes, metrics.MEMORY_BUCKETS,
+                             "In-memory size of session datasets")
+    alerts.append(html.P(f"Dataset: {len(dataset):,} rows, {dataset_bytes / 1024 ** 2:.1f} MB in memory",
+                         className='text-muted'))
+
+    # Fichiers de cet import relus depuis le cache des rapports / parsés ; les
+    # totaux sont exposés par /metrics
+    if report_cache is not None:
+        stats = report_cache.stats()
+        alerts.append(html.P(f"Report cache for this upload: {stats['hits'] - cache_before['hits']} "
+                             f"files reused / {stats['misses'] - cache_before['misses']} parsed",
+                             className='text-muted'))
+
+    return alerts + [table], dataset_key
+
+
+# Importer les fichiers en relevant les mesures prises pendant l'import : en tâche
+# de fond, elles sont prises dans un autre processus et n'atteindraient pas /metrics.
+# Elles sont renvoyées avec la clé du jeu de données remplacé dans upload-report
+def upload(contents, filenames, previous_key, append, set_progress=None):
+    if contents is None:
+        return None, None, dash.no_update
+    with metrics.capture() as measurements:
+        children, dataset_key = update_table(contents, filenames, previous_key, append, set_progress)
+    # Le jeu de données précédent n'est remplacé que si un nouveau a été enregistré
+    replaced = previous_key if dataset_key is not dash.no_update else None
+    return children, dataset_key, {'measurements': measurements, 'replaced': replaced}
+
+
+UPLOAD_OUTPUTS = [Output('output-data-upload', 'children'),
+                  Output('stored-data', 'data'),
+                  Output('upload-report', 'data')]
+UPLOAD_STATES = [State('upload-data', 'filename'),
+                 State('stored-data', 'data'),
+                 State('append-mode', 'value')]
+
+if background_manager is not None:
+    # Import dans un processus de fond : le worker web reste libre, la progression
+    # est relue par le navigateur et le bouton "Cancel" arrête le processus
+    @app.callback(
+        UPLOAD_OUTPUTS,
+        Input('upload-data', 'contents'),
+        UPLOAD_STATES,
+        background=True,
+        manager=background_manager,
+        progress=[Output('upload-progress', 'value'),
+                  Output('upload-progress', 'label'),
+                  Output('upload-files-progress', 'children')],
+        running=[(Output('upload-data', 'disabled'), True, False),
+                 (Output('cancel-upload', 'disabled'), False, True),
+                 (Output('upload-progress-container', 'style'), {'margin-top': '10px'}, {'display': 'none'})],
+        cancel=[Input('cancel-upload', 'n_clicks')],
+        prevent_initial_call=True,
+    )
+    def update_table_background(set_progress, contents, filenames, previous_key, append):
+        return upload(contents, filenames, previous_key, append, set_progress=set_progress)
+else:
+    app.callback(UPLOAD_OUTPUTS, Input('upload-data', 'contents'), UPLOAD_STATES)(upload)
+
+
+# Callback pour enregistrer, dans le processus web, les mesures de l'import et
+# oublier les rendus mis en cache du jeu de données remplacé (ou étendu sous
+# une nouvelle clé), qui sont périmés
+@app.callback(Input('upload-report', 'data'), prevent_initial_call=True)
+def record_upload(report):
+    if report is None:
+        return
+    metrics.replay(report['measurements'])
+    if report['replaced'] is not None:
+        render_cache.invalidate(report['replaced'])
+
+
+# Options d'un dropdown de queries : les meilleures correspondances au texte saisi,
+# plus les queries déjà sélectionnées (sans lesquelles Dash ne sait pas les afficher)
+def query_options(dataset, search_value, selected):
+    selected = [query for query in (selected if isinstance(selected, list) else [selected]) if query is not None]
+    matches = dataset.search.search(search_value, QUERY_OPTIONS_LIMIT)
+    queries = selected + [query for query in matches if query not in selected]
+    return [{'label': query, 'value': query} for query in queries]
+
+
+# Callback pour chercher les Search Query côté serveur pendant la saisie
+@app.callback(
+    Output('query-dropdown', 'options'),
+    [Input('query-dropdown', 'search_value'),
+     Input('stored-data', 'data')],
+    State('query-dropdown', 'value')
+)
+@metrics.instrument('search_queries')
+def search_queries(search_value, data, selected_query):
+    dataset = dataset_store.get(data) if data is not None else None
+    if dataset is None:
+        return []
+    return query_options(dataset, search_value, selected_query)
+
+
+# Callback pour paginer, trier et filtrer la table des données brutes côté serveur
+@app.callback(
+    [Output('raw-table', 'data'),
+     Output('raw-table', 'page_count')],
+    [Input('raw-table', 'page_current'),
+     Input('raw-table', 'page_size'),
+     Input('raw-table', 'sort_by'),
+     Input('raw-table', 'filter_query'),
+     Input('stored-data', 'data')]
+)
+@metrics.instrument('update_raw_table')
+def update_raw_table(page_current, page_size, sort_by, filter_query, data):
+    dataset = dataset_store.get(data) if data is not None else None
+    if dataset is None:
+        return [], 1
+
+    with metrics.stage('page'):
+        page = table_page(dataset.df, page_current, page_size, sort_by, filter_query, cache_key=data,
+                          decimals=DISPLAY_DECIMALS)
+    metrics.add_rows(len(page[0]))
+    return page
+
+
+# Callback pour paginer, trier et filtrer la vue "Alerts" côté serveur
+@app.callback(
+    [Output('alerts-table', 'data'),
+     Output('alerts-table', 'page_count'),
+     Output('alerts-summary', 'children')],
+    [Input('alerts-table', 'page_current'),
+     Input('alerts-table', 'page_size'),
+     Input('alerts-table', 'sort_by'),
+     Input('alerts-table', 'filter_query'),
+     Input('stored-data', 'data')]
+)
+@metrics.instrument('update_alerts_table')
+def update_alerts_table(page_current, page_size, sort_by, filter_query, data):
+    dataset = dataset_store.get(data) if data is not None else None
+    if dataset is None:
+        return [], 1, None
+
+    with metrics.stage('page'):
+        page = table_page(dataset.alerts, page_current, page_size, sort_by, filter_query,
+                          cache_key=(data, 'alerts'))
+    metrics.add_rows(len(page[0]))
+
+    changes = int(dataset.alerts['Alert'].str.contains("Strategy change", regex=False).sum())
+    summary = html.P(f"{len(dataset.alerts):,} queries flagged out of {len(dataset.queries):,}, "
+                     f"including {changes:,} strategy changes")
+    return page[0], page[1], summary
+
+
+# Callback pour envoyer au navigateur le bundle de la Search Query choisie : ses
+# dates, les valeurs des cartes KPI et les parts du funnel pour chaque date, et
+# la série des Δ. Changer de date ne sollicite plus le serveur
+@app.callback(
+    Output('query-bundle', 'data'),
+    [Input('query-dropdown', 'value'),
+     Input('stored-data', 'data')]
+)
+@metrics.instrument('update_query_bundle')
+def update_query_bundle(selected_query, data):
+    if selected_query is None or data is None:
+        return None
+
+    # Bundle déjà calculé pour cette version du jeu de données
+    cached = render_cache.get(data, selected_query, None)
+    if cached is not None:
+        return cached
+
+    # Récupérer le jeu de données indexé depuis le stockage serveur
+    with metrics.stage('lookup'):
+        dataset = dataset_store.get(data)
+        if dataset is None:
+            return None
+
+        # Série temporelle de la query, lue via l'index, arrondie pour l'affichage
+        df_graph = for_display(dataset.series(selected_query))
+    metrics.add_rows(len(df_graph))
+
+    with metrics.stage('bundle_build'):
+        bundle = query_bundle(selected_query, df_graph)
+    render_cache.put(data, selected_query, None, bundle)
+    return bundle
+
+
+# Bundle d'une query : une entrée par date (la première ligne si une date est en
+# double), valeurs des cartes dans l'ordre de KPI_FIELDS
+def query_bundle(selected_query, df_graph):
+    dates = df_graph['Reporting Date'].dt.strftime('%Y-%m-%d')
+    values, funnel = {}, {}
+    for i, date in enumerate(dates):
+        if isinstance(date, str) and date not in values:
+            filtered_df = df_graph.iloc[i]
+            values[date] = kpi_values(filtered_df)
+            funnel[date] = [
+                filtered_df["Impressions: Brand Share %"],
+                filtered_df["Clicks: Brand Share %"],
+                filtered_df["Basket Adds: Brand Share %"],
+                filtered_df["Purchases: Brand Share %"]]
+
+    return {
+        'query': selected_query,
+        'dates': sorted(values),
+        'values': values,
+        'funnel': funnel,
+        'delta': {
+            'x': dates.tolist(),
+            'ctr': df_graph['Δ_CTR'].tolist(),
+            'cvr': df_graph['Δ_CVR'].tolist(),
+        },
+    }
+
+
+# Valeurs formatées des cartes KPI d'une ligne (query, date), dans l'ordre de KPI_FIELDS
+def kpi_values(filtered_df):
+    values = {
+        'impressions-total': f"{filtered_df['Impressions: Total Count']:,}",
+        'impressions-brand': f"{filtered_df['Impressions: Brand Count']:,}",
+        'impressions-share': f"{filtered_df['Impressions: Brand Share %']:,}"+" %",
+        'clicks-total': f"{filtered_df['Clicks: Total Count']:,}",
+        'clicks-brand': f"{filtered_df['Clicks: Brand Count']:,}",
+        'clicks-share': f"{filtered_df['Clicks: Brand Share %']:,}"+" %",
+        'basket-total': f"{filtered_df['Basket Adds: Total Count']:,}",
+        'basket-brand': f"{filtered_df['Basket Adds: Brand Count']:,}",
+        'basket-share': f"{filtered_df['Basket Adds: Brand Share %']:,}"+" %",
+        'purchases-total': f"{filtered_df['Purchases: Total Count']:,}",
+        'purchases-brand': f"{filtered_df['Purchases: Brand Count']:,}",
+        'purchases-share': f"{filtered_df['Purchases: Brand Share %']:,}"+" %",
+        'clicks-rate': f"{filtered_df['Clicks: Click Rate %']:.2f}%",
+        'clicks-brand-rate': f"{filtered_df['Clicks: Brand Share %']:.2f}%",
+        'clicks-price': f"{filtered_df['Clicks: Price (Median)']:,}",
+        'clicks-brand-price': f"{filtered_df['Clicks: Brand Price (Median)']:,}",
+        'clicks-price-diff': f"{filtered_df['Clicks: Price (Median)'] - filtered_df['Clicks: Brand Price (Median)']:.2f}",
+        'clicks-same-day': f"{filtered_df['Clicks: Same-Day Shipping Speed']:,}",
+        'clicks-1d': f"{filtered_df['Clicks: 1D-Shipping Speed']:,}",
+        'clicks-2d': f"{filtered_df['Clicks: 2D-Shipping Speed']:,}",
+        'basket-rate': f"{filtered_df['Basket Adds: Basket Add Rate %']:.2f}%",
+        'basket-brand-rate': f"{filtered_df['Basket Adds: Brand Share %']:.2f}%",
+        'basket-price': f"{filtered_df['Basket Adds: Price (Median)']:.2f}",
+        'basket-brand-price': f"{filtered_df['Basket Adds: Brand Price (Median)']:.2f}",
+        'basket-price-diff': f"{filtered_df['Basket Adds: Price (Median)'] - filtered_df['Basket Adds: Brand Price (Median)']:.2f}",
+        'basket-same-day': f"{filtered_df['Basket Adds: Same-Day Shipping Speed']:,}",
+        'basket-1d': f"{filtered_df['Basket Adds: 1D-Shipping Speed']:,}",
+        'basket-2d': f"{filtered_df['Basket Adds: 2D-Shipping Speed']:,}",
+        'purchases-rate': f"{filtered_df['Purchases: Purchase Rate %']:.2f}%",
+        'purchases-brand-rate': f"{filtered_df['Purchases: Brand Share %']:.2f}%",
+        'purchases-price': f"{filtered_df['Purchases: Price (Median)']:.2f}",
+        'purchases-brand-price': f"{filtered_df['Purchases: Brand Price (Median)']:.2f}",
+        'purchases-price-diff': f"{filtered_df['Purchases: Price (Median)'] - filtered_df['Purchases: Brand Price (Median)']:.2f}",
+        'purchases-same-day': f"{filtered_df['Purchases: Same-Day Shipping Speed']:,}",
+        'purchases-1d': f"{filtered_df['Purchases: 1D-Shipping Speed']:,}",
+        'purchases-2d': f"{filtered_df['Purchases: 2D-Shipping Speed']:,}",
+    }
+
+    return [values[field] for field in KPI_FIELDS]
+
+
+# Options des dates, cartes KPI, funnel et graphique des Δ rendus dans le
+# navigateur à partir du bundle de la query (assets/focus.js)
+app.clientside_callback(
+    ClientsideFunction(namespace='focus', function_name='date_options'),
+    Output('date-dropdown', 'options'),
+    Input('query-bundle', 'data')
+)
+
+app.clientside_callback(
+    ClientsideFunction(namespace='focus', function_name='render'),
+    [Output(kpi_id(ALL), 'children'),
+     Output('funnel-chart', 'figure'),
+     Output('delta-chart', 'figure')],
+    [Input('date-dropdown', 'value'),
+     Input('query-bundle', 'data')],
+    [State('funnel-chart', 'figure'),
+     State('delta-chart', 'figure')]
+)
+
+
+# Callback pour initialiser les filtres de l'onglet "Portfolio" après un import
+@app.callback(
+    [Output('portfolio-dates', 'min_date_allowed'),
+     Output('portfolio-dates', 'max_date_allowed'),
+     Output('portfolio-dates', 'start_date'),
+     Output('portfolio-dates', 'end_date')],
+    Input('stored-data', 'data')
+)
+@metrics.instrument('init_portfolio')
+def init_portfolio(data):
+    dataset = dataset_store.get(data) if data is not None else None
+    if dataset is None or len(dataset.rollup.periods('week')) == 0:
+        return None, None, None, None
+
+    weeks = pd.DatetimeIndex(dataset.rollup.periods('week')).strftime('%Y-%m-%d')
+    return weeks[0], weeks[-1], weeks[0], weeks[-1]
+
+
+# Callback pour chercher les queries de l'onglet "Portfolio" pendant la saisie
+@app.callback(
+    Output('portfolio-queries', 'options'),
+    [Input('portfolio-queries', 'search_value'),
+     Input('stored-data', 'data')],
+    State('portfolio-queries', 'value')
+)
+@metrics.instrument('search_portfolio_queries')
+def search_portfolio_queries(search_value, data, selected_queries):
+    dataset = dataset_store.get(data) if data is not None else None
+    if dataset is None:
+        return []
+    return query_options(dataset, search_value, selected_queries)
+
+
+# Callback pour les totaux de l'onglet "Portfolio" : lus uniquement dans le cube
+# d'agrégats, quelle que soit la taille du jeu de données
+@app.callback(
+    [Output('portfolio-summary', 'children'),
+     Output('portfolio-chart', 'figure'),
+     Output('portfolio-table', 'children')],
+    [Input('portfolio-queries', 'value'),
+     Input('portfolio-grain', 'value'),
+     Input('portfolio-dates', 'start_date'),
+     Input('portfolio-dates', 'end_date'),
+     Input('stored-data', 'data')]
+)
+@metrics.instrument('update_portfolio')
+def update_portfolio(selected_queries, grain, start_date, end_date, data):
+    dataset = dataset_store.get(data) if data is not None else None
+    if dataset is None:
+        return None, go.Figure(), None
+
+    with metrics.stage('lookup'):
+        periods = dataset.rollup.series(grain, selected_queries, start_date, end_date)
+        totals = dataset.rollup.total(grain, selected_queries, start_date, end_date)
+    metrics.add_rows(len(periods))
+
+    with metrics.stage('figure_build'):
+        return render_portfolio(periods, totals, grain)
+
+
+def _portfolio_card(title, icon, total, brand):
+    return html.Div([
+        html.H4(title, style={'text-align': 'center'}),
+        html.P(icon, style={'font-size': '32px', 'text-align': 'center'}),
+        html.Div([
+            html.P("Total", style={'font-size': '16px', 'color': 'blue', 'text-align': 'center'}),
+            html.P(f"{total:,}", style={
+                'font-size': '24px', 'color': 'blue', 'text-align': 'center',
+                'border': '2px solid blue', 'padding': '10px', 'border-radius': '5px'}),
+        ]),
+        html.Div([
+            html.P("Brand", style={'font-size': '16px', 'color': 'green', 'text-align': 'center'}),
+            html.P(f"{brand:,}", style={
+                'font-size': '24px', 'color': 'green', 'text-align': 'center',
+                'border': '2px solid green', 'padding': '10px', 'border-radius': '5px'}),
+        ]),
+    ], style={'display': 'inline-block', 'width': '19%', 'margin': '10px'})
+
+
+def _percent(value):
+    return "n/a" if pd.isna(value) else f"{value * 100:.2f}%"
+
+
+# Construire les totaux, le graphique et la table par période de l'onglet "Portfolio"
+def render_portfolio(periods, totals, grain):
+    summary = [
+        _portfolio_card("Impressions", "📊", totals['Impressions: Total Count'], totals['Impressions: Brand Count']),
+        _portfolio_card("Clicks", "👆", totals['Clicks: Total Count'], totals['Clicks: Brand Count']),
+        _portfolio_card("Basket Adds", "🛒", totals['Basket Adds: Total Count'], totals['Basket Adds: Brand Count']),
+        _portfolio_card("Purchases", "💳", totals['Purchases: Total Count'], totals['Purchases: Brand Count']),
+        html.Div([
+            html.H4("CTR / CVR", style={'text-align': 'center'}),
+            html.P(f"CTR : {_percent(totals['Brand_CTR'])} vs {_percent(totals['Market_CTR'])}",
+                   style={'font-size': '18px', 'color': 'blue', 'text-align': 'center'}),
+            html.P(f"CVR : {_percent(totals['Brand_CVR'])} vs {_percent(totals['Market_CVR'])}",
+                   style={'font-size': '18px', 'color': 'blue', 'text-align': 'center'}),
+            html.P(totals['strategy'], style={
+                'font-size': '24px', 'color': 'red', 'text-align': 'center',
+                'border': '2px solid red', 'padding': '10px', 'border-radius': '5px'}),
+        ], style={'display': 'inline-block', 'width': '19%', 'margin': '10px'}),
+    ]
+
+    # Mois / trimestre coupé par la plage de dates : seules ses semaines de la plage sont comptées
+    labels = [f"{label} (partial)" if partial else label
+              for label, partial in zip(period_labels(periods['Period'], grain), periods['Partial'])]
+
+    chart = go.Figure()
+    for column, color, dash_style in (('Brand_CTR', 'blue', 'solid'), ('Market_CTR', 'blue', 'dot'),
+                                      ('Brand_CVR', 'green', 'solid'), ('Market_CVR', 'green', 'dot')):
+        chart.add_trace(go.Scatter(x=labels, y=periods[column], mode='lines+markers', name=column,
+                                   line=dict(color=color, dash=dash_style)))
+    chart.update_layout(
+        title='CTR & CVR by period (from summed counts)',
+        xaxis_title='Period',
+        yaxis_title='Rate',
+        yaxis_tickformat='.1%',
+        legend=dict(x=0, y=1),
+        margin=dict(l=0, r=0, t=30, b=0),
+        height=400
+    )
+
+    percent = FormatTemplate.percentage(2)
+    rate_columns = ['Market_CTR', 'Brand_CTR', 'Δ_CTR', 'Δ_CTR vs previous',
+                    'Market_CVR', 'Brand_CVR', 'Δ_CVR', 'Δ_CVR vs previous']
+    columns = ([{'name': 'Period', 'id': 'Period'}]
+               + [{'name': col, 'id': col, 'type': 'numeric'} for col in COUNT_COLUMNS]
+               + [{'name': col, 'id': col, 'type': 'numeric', 'format': percent} for col in rate_columns]
+               + [{'name': 'strategy', 'id': 'strategy'}])
+    records = periods.assign(Period=labels, strategy=periods['strategy'].astype(str))
+    table = dash_table.DataTable(
+        columns=columns,
+        data=records[[col['id'] for col in columns]].to_dict('records'),
+        sort_action='native',
+        style_table={'overflowX': 'auto'},
+        style_header={'backgroundColor': '#212529', 'color': 'white', 'fontWeight': 'bold'},
+        style_data={'backgroundColor': '#343a40', 'color': 'white'},
+        style_data_conditional=[{'if': {'row_index': 'odd'}, 'backgroundColor': '#2c3034'}],
+    )
+
+    return summary, chart.to_dict(), table
+
+
+# Callback pour les liens de téléchargement : jeu de données complet, et
+# sélection de l'onglet "Portfolio"
+@app.callback(
+    [Output('export-links', 'children'),
+     Output('portfolio-export', 'href')],
+    [Input('stored-data', 'data'),
+     Input('portfolio-queries', 'value'),
+     Input('portfolio-dates', 'start_date'),
+     Input('portfolio-dates', 'end_date')]
+)
+@metrics.instrument('update_export_links')
+def update_export_links(data, selected_queries, start_date, end_date):
+    if data is None:
+        return None, None
+
+    links = ["Download the enriched data: "]
+    for fmt in EXPORT_FORMATS:
+        links.append(html.A(fmt.upper(), href=f"/export/{data}?format={fmt}", style={'margin-right': '10px'}))
+
+    params = [('query', query) for query in selected_queries or []]
+    params += [(name, value) for name, value in [('start', start_date), ('end', end_date)] if value]
+    return links, f"/export/{data}?{urlencode(params + [('format', 'csv')])}"
+
+
+# Télécharger en flux le jeu de données enrichi d'une session : entier, ou les
+# lignes des queries ?query=...&query=... dont la date est dans [start, end].
+# ?format=csv (par défaut), parquet ou arrow
+@server.route('/export/<key>')
+def export_dataset(key):
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        abort(400, f"Unknown format {fmt!r}, expected one of {', '.join(EXPORT_FORMATS)}")
+    if fmt != 'csv':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            abort(501, "pyarrow is not installed, only CSV exports are available")
+
+    dataset = dataset_store.get(key)
+    if dataset is None:
+        abort(404)
+    try:
+        positions = dataset.select(request.args.getlist('query'),
+                                   request.args.get('start') or None, request.args.get('end') or None)
+    except ValueError:
+        abort(400, "start and end must be dates (YYYY-MM-DD)")
+
+    metrics.registry.inc('amazonkpi_export_rows_total', {'format': fmt}, len(positions),
+                         "Rows exported through /export")
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    return Response(export_chunks(dataset.df, positions, fmt), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="amazonkpi-{key[:8]}.{extension}"'})
+
 
-    return kpi_layout, funnel_chart, kpi_section, delta_chart
+# Mesures des callbacks au format texte de Prometheus
+@server.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
 
 
 # Lancer l'application
@@ -0,0 +1,409 @@
+# Lecture des rapports "Search Query Performance" d'Amazon Brand Analytics.
+#
+# Les octets décodés sont lus directement (io.BytesIO) sans copie intermédiaire
+# en str, avec un schéma de types fixe pour les colonnes connues. Les gros
+# fichiers sont lus par blocs et le moteur CSV de pyarrow peut être utilisé
+# s'il est installé. Plusieurs fichiers sont lus en parallèle dans un pool de
+# processus, qui calcule aussi les KPIs et alimente le cache des rapports.
+#
+# Comparer l'ancien et le nouveau chemin de lecture sur un export :
+#     python ingest.py rapport.csv [--engine pyarrow]
+import argparse
+import base64
+import io
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+
+import metrics
+from kpi import compute_kpis
+from report_cache import digest, get_report_cache
+
+logger = logging.getLogger(__name__)
+
+COUNT_COLUMNS = [
+    'Search Query Score', 'Search Query Volume',
+    'Impressions: Total Count', 'Impressions: Brand Count',
+    'Clicks: Total Count', 'Clicks: Brand Count',
+    'Clicks: Same-Day Shipping Speed', 'Clicks: 1D-Shipping Speed', 'Clicks: 2D-Shipping Speed',
+    'Basket Adds: Total Count', 'Basket Adds: Brand Count',
+    'Basket Adds: Same-Day Shipping Speed', 'Basket Adds: 1D-Shipping Speed', 'Basket Adds: 2D-Shipping Speed',
+    'Purchases: Total Count', 'Purchases: Brand Count',
+    'Purchases: Same-Day Shipping Speed', 'Purchases: 1D-Shipping Speed', 'Purchases: 2D-Shipping Speed',
+]
+
+RATE_COLUMNS = [
+    'Impressions: Brand Share %',
+    'Clicks: Click Rate %', 'Clicks: Brand Share %',
+    'Clicks: Price (Median)', 'Clicks: Brand Price (Median)',
+    'Basket Adds: Basket Add Rate %', 'Basket Adds: Brand Share %',
+    'Basket Adds: Price (Median)', 'Basket Adds: Brand Price (Median)',
+    'Purchases: Purchase Rate %', 'Purchases: Brand Share %',
+    'Purchases: Price (Median)', 'Purchases: Brand Price (Median)',
+]
+
+# Schéma des colonnes connues ; "Reporting Date" est convertie après lecture
+SCHEMA = {'Search Query': 'object', 'Reporting Date': 'object'}
+SCHEMA.update({col: 'int64' for col in COUNT_COLUMNS})
+SCHEMA.update({col: 'float64' for col in RATE_COLUMNS})
+
+# Au-delà de cette taille (octets), le fichier est lu par blocs de CHUNK_ROWS lignes
+CHUNK_THRESHOLD = int(os.environ.get('AMAZONKPI_CHUNK_THRESHOLD', str(64 * 1024 * 1024)))
+CHUNK_ROWS = int(os.environ.get('AMAZONKPI_CHUNK_ROWS', '200000'))
+
+# Moteur CSV par défaut : "c" (pandas) ou "pyarrow"
+CSV_ENGINE = os.environ.get('AMAZONKPI_CSV_ENGINE', 'c')
+
+# Nombre de processus pour lire plusieurs fichiers en parallèle
+INGEST_WORKERS = int(os.environ.get('AMAZONKPI_INGEST_WORKERS', str(os.cpu_count() or 1)))
+
+
+try:
+    from pyarrow import ArrowInvalid
+except ImportError:
+    # Jamais levée lorsque pyarrow est absent
+    class ArrowInvalid(Exception):
+        pass
+
+
+def pyarrow_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+# Décoder le contenu "data:...;base64,..." envoyé par dcc.Upload
+def decode_contents(content):
+    content_string = content[content.index(',') + 1:]
+    return base64.b64decode(content_string)
+
+
+# Colonnes du fichier (la première ligne du rapport est un en-tête de métadonnées)
+def _read_columns(data):
+    return pd.read_csv(io.BytesIO(data), skiprows=1, nrows=0).columns
+
+
+def _finalize(df):
+    # Convertir la colonne "Reporting Date" en datetime
+    df['Reporting Date'] = pd.to_datetime(df['Reporting Date'], errors='coerce')
+    return df
+
+
+# Lire un rapport à partir des octets décodés
+def read_report(data, engine=None, chunk_threshold=None, chunksize=None):
+    engine = engine or CSV_ENGINE
+    chunk_threshold = CHUNK_THRESHOLD if chunk_threshold is None else chunk_threshold
+    chunksize = chunksize or CHUNK_ROWS
+
+    if engine == 'pyarrow' and not pyarrow_available():
+        logger.warning("pyarrow is not installed, falling back to the C CSV engine")
+        engine = 'c'
+
+    columns = _read_columns(data)
+    dtype = {col: SCHEMA[col] for col in columns if col in SCHEMA}
+
+    try:
+        return _read(data, dtype, engine, chunk_threshold, chunksize)
+    except (ValueError, TypeError, OverflowError, ArrowInvalid):
+        # Comptages vides ou non entiers : laisser pandas inférer ces colonnes
+        logger.warning("Report does not match the count schema, inferring count dtypes")
+        dtype = {col: kind for col, kind in dtype.items() if kind != 'int64'}
+        return _read(data, dtype, engine, chunk_threshold, chunksize)
+
+
+# Lecture multi-thread avec pyarrow.csv, directement sur le buffer d'octets
+def _read_pyarrow(data, dtype):
+    import pyarrow as pa
+    from pyarrow import csv
+
+    arrow_types = {'int64': pa.int64(), 'float64': pa.float64(), 'object': pa.string()}
+    table = csv.read_csv(
+        pa.BufferReader(pa.py_buffer(data)),
+        read_options=csv.ReadOptions(skip_rows=1),
+        convert_options=csv.ConvertOptions(
+            column_types={col: arrow_types[kind] for col, kind in dtype.items()}),
+    )
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def _read(data, dtype, engine, chunk_threshold, chunksize):
+    # Le moteur pyarrow lit tout le fichier en parallèle et ne gère pas chunksize
+    if engine == 'pyarrow':
+        return _finalize(_read_pyarrow(data, dtype))
+
+    buffer = io.BytesIO(data)
+    if len(data) <= chunk_threshold:
+        return _finalize(pd.read_csv(buffer, skiprows=1, dtype=dtype))
+
+    # Lecture par blocs : les dates texte de chaque bloc sont libérées aussitôt converties
+    chunks = [_finalize(chunk) for chunk in pd.read_csv(
+        buffer, skiprows=1, dtype=dtype, engine='c', chunksize=chunksize)]
+    return pd.concat(chunks, ignore_index=True)
+
+
+# Décoder puis lire un fichier envoyé par dcc.Upload
+def parse_contents(content, engine=None):
+    start = time.perf_counter()
+    data = decode_contents(content)
+    decoded = time.perf_counter()
+    df = read_report(data, engine=engine)
+    parsed = time.perf_counter()
+    logger.info("Parsed %d rows (%.1f MB) in %.3fs (decode %.3fs)",
+                len(df), len(data) / 1e6, parsed - decoded, decoded - start)
+    return df
+
+
+# Lire un fichier et calculer ses KPIs dans un processus du pool.
+# Retourne (DataFrame, clé du cache, hit, erreur, durées des étapes). Lorsque le
+# cache est actif, le DataFrame n'est pas renvoyé : le processus principal le
+# relit par memory-map, ce qui évite de le sérialiser entre processus. L'erreur
+# est renvoyée sous forme de texte pour qu'un fichier invalide n'interrompe pas
+# tout l'upload.
+def _ingest_file(content, engine):
+    timings = {}
+    try:
+        start = time.perf_counter()
+        data = decode_contents(content)
+        timings['decode'] = time.perf_counter() - start
+
+        cache = get_report_cache()
+        key = None
+        if cache is not None:
+            key = digest(data)
+            if key in cache:
+                return None, key, True, None, timings
+
+        start = time.perf_counter()
+        df = read_report(data, engine=engine)
+        timings['parse'] = time.perf_counter() - start
+        start = time.perf_counter()
+        df = compute_kpis(df, inplace=True)
+        timings['kpi'] = time.perf_counter() - start
+        if cache is None:
+            return df, None, False, None, timings
+
+        start = time.perf_counter()
+        try:
+            cache.save(key, df)
+        except OSError as e:
+            logger.warning("Could not write report cache entry %s: %s", key, e)
+            return df, None, False, None, timings
+        timings['cache_write'] = time.perf_counter() - start
+        return None, key, False, None, timings
+    except Exception as e:
+        return None, None, False, f"{type(e).__name__}: {e}", timings
+
+
+_pool = None
+_pool_workers = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+# Processus d'une tâche de fond Dash (DiskcacheManager la lance avec multiprocess)
+def _in_background_job():
+    try:
+        import multiprocess
+    except ImportError:
+        return False
+    return multiprocess.parent_process() is not None
+
+
+# Pool de processus partagé entre les uploads, créé à la première utilisation.
+# Dans le worker web, "spawn" évite de dupliquer par fork l'état (threads,
+# sockets) du serveur. Une tâche de fond Dash est un processus créé par fork,
+# qui ne sert qu'à un import et dont le pool disparaît avec lui : ses
+# processus de lecture y sont créés par fork, sans réimporter pandas dans
+# chacun comme le ferait "spawn" à chaque import.
+def _get_pool(max_workers):
+    global _pool, _pool_workers, _pool_pid
+    with _pool_lock:
+        if _pool_pid != os.getpid():
+            # Processus créé par fork (tâche de fond Dash) : le pool hérité n'a
+            # plus ses threads de gestion, en créer un nouveau
+            _pool = None
+        if _pool is None or _pool_workers != max_workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            import multiprocessing
+            method = 'fork' if _in_background_job() else 'spawn'
+            _pool = ProcessPoolExecutor(max_workers=max_workers,
+                                        mp_context=multiprocessing.get_context(method))
+            _pool_workers = max_workers
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+# État d'un fichier lu par _ingest_file : "failed", "cached" (relu depuis le cache) ou "done"
+def _outcome_status(outcome):
+    df, key, hit, error, timings = outcome
+    if error is not None:
+        return 'failed'
+    return 'cached' if hit else 'done'
+
+
+# Lire plusieurs fichiers et calculer leurs KPIs, en parallèle si possible.
+# Retourne (résultats, erreurs) : résultats est la liste des (nom, DataFrame)
+# dans l'ordre des fichiers envoyés, erreurs la liste des (nom, message).
+# progress, s'il est fourni, reçoit la liste des états des fichiers ("queued",
+# "parsing", "cached", "done" ou "failed") à chaque changement.
+def ingest_many(contents, filenames=None, max_workers=None, engine=None, progress=None):
+    if filenames is None:
+        filenames = [f"file {i + 1}" for i in range(len(contents))]
+    max_workers = max_workers or INGEST_WORKERS
+    statuses = ['queued'] * len(contents)
+
+    def report():
+        if progress is not None:
+            progress(list(statuses))
+
+    if max_workers <= 1 or len(contents) <= 1:
+        outcomes = []
+        for i, content in enumerate(contents):
+            statuses[i] = 'parsing'
+            report()
+            outcomes.append(_ingest_file(content, engine))
+            statuses[i] = _outcome_status(outcomes[-1])
+        report()
+    else:
+        pool = _get_pool(max_workers)
+        futures = [pool.submit(_ingest_file, content, engine) for content in contents]
+        outcomes = [None] * len(futures)
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            previous = list(statuses)
+            for i, future in enumerate(futures):
+                if future in done:
+                    try:
+                        outcomes[i] = future.result()
+                    except BrokenProcessPool:
+                        # Un processus a été tué (mémoire insuffisante...) : recréer le pool au prochain upload
+                        _reset_pool()
+                        outcomes[i] = (None, None, False, "worker process died while parsing this file", {})
+                    statuses[i] = _outcome_status(outcomes[i])
+                elif statuses[i] == 'queued' and future.running():
+                    statuses[i] = 'parsing'
+            if statuses != previous:
+                report()
+
+    cache = get_report_cache()
+    results, errors = [], []
+    for filename, content, (df, key, hit, error, timings) in zip(filenames, contents, outcomes):
+        for stage, seconds in timings.items():
+            metrics.observe_stage(stage, seconds)
+        if error is not None:
+            logger.warning("Failed to parse %s: %s", filename, error)
+            errors.append((filename, error))
+            continue
+
+        if cache is not None and key is not None:
+            cache.record(hit)
+            # Compteurs /metrics : enregistrés par le registre (et non lus sur le
+            # cache) pour être relevés aussi dans une tâche de fond
+            if hit:
+                metrics.registry.inc('amazonkpi_report_cache_hits_total', {}, 1,
+                                     "Uploaded reports read back from the report cache")
+            else:
+                metrics.registry.inc('amazonkpi_report_cache_misses_total', {}, 1, "Uploaded reports parsed")
+            with metrics.stage('cache_read'):
+                df = cache.load(key)
+            if df is None:
+                # Entrée évincée entre l'écriture et la lecture : relire le fichier
+                df = compute_kpis(read_report(decode_contents(content), engine=engine), inplace=True)
+        results.append((filename, df))
+    return results, errors
+
+
+# Ancien chemin de lecture, conservé pour les comparaisons
+def legacy_parse_contents(content):
+    content_type, content_string = content.split(',')
+    decoded = base64.b64decode(content_string)
+    df = pd.read_csv(io.StringIO(decoded.decode('utf-8')), skiprows=1)
+    df['Reporting Date'] = pd.to_datetime(df['Reporting Date'], errors='coerce')
+    return df
+
+
+# Mémoire résidente courante du processus (Linux), en Mo
+def _rss_mb():
+    with open('/proc/self/statm') as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf('SC_PAGE_SIZE') / 1e6
+
+
+# Mesurer le temps et le pic mémoire d'un chemin de lecture.
+# La mémoire résidente est échantillonnée pendant la lecture : ru_maxrss ne
+# conviendrait pas, son maximum inclut déjà la construction du contenu base64.
+def _measure(path, method, engine):
+    import gc
+    import threading
+
+    with open(path, 'rb') as f:
+        content = 'data:text/csv;base64,' + base64.b64encode(f.read()).decode('ascii')
+    gc.collect()
+    baseline = _rss_mb()
+    peak = [baseline]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(0.005):
+            peak[0] = max(peak[0], _rss_mb())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    if method == 'legacy':
+        df = legacy_parse_contents(content)
+    else:
+        df = parse_contents(content, engine=engine)
+    elapsed = time.perf_counter() - start
+    done.set()
+    sampler.join()
+
+    return {
+        'method': method,
+        'engine': engine if method != 'legacy' else 'c',
+        'rows': len(df),
+        'seconds': round(elapsed, 3),
+        'peak_memory_mb': round(max(peak[0], _rss_mb()) - baseline, 1),
+        'result_memory_mb': round(df.memory_usage(deep=True).sum() / 1e6, 1),
+    }
+
+
+def compare(path, engine=None):
+    import multiprocessing
+
+    ctx = multiprocessing.get_context('spawn')
+    results = []
+    for method in ('legacy', 'schema'):
+        # Un processus neuf par mesure pour ne pas hériter de la mémoire de la précédente
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as executor:
+            results.append(executor.submit(_measure, path, method, engine or CSV_ENGINE).result())
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare report ingestion paths (time and peak memory).")
+    parser.add_argument('path', help="Search Query Performance CSV export")
+    parser.add_argument('--engine', choices=['c', 'pyarrow'], default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps({'file': args.path, 'size_mb': round(os.path.getsize(args.path) / 1e6, 1),
+                      'results': compare(args.path, args.engine)}, indent=2))
@@ -0,0 +1,45 @@
+# Exécution en tâche de fond des callbacks Dash longs (import des gros uploads).
+#
+# DiskcacheManager lance chaque tâche dans un processus local et échange la
+# progression et le résultat par un cache sur disque : pas de broker (Redis,
+# Celery) à déployer, et le worker gunicorn reste libre pour les autres sessions
+# pendant l'import. Le jeu de données produit par la tâche n'est visible des
+# workers web que si le stockage des sessions est sur disque : avec
+# AMAZONKPI_STORE_BACKEND=memory, l'import reste synchrone. Les mesures prises
+# pendant la tâche sont renvoyées avec son résultat (metrics.capture) et
+# enregistrées par le processus web.
+#
+# diskcache enregistre les résultats des tâches avec pickle et le processus web
+# les relit : comme pour data_store, le dossier est privé (0700) et propre à
+# l'utilisateur.
+#
+# Variables d'environnement :
+#   AMAZONKPI_BACKGROUND=0         importer dans le callback, sans tâche de fond
+#   AMAZONKPI_JOBS_DIR=/tmp/jobs   dossier du cache des tâches (par défaut
+#                                  /tmp/amazonkpi-jobs-<uid>)
+#   AMAZONKPI_JOBS_EXPIRE=3600     durée de conservation des résultats (secondes)
+import logging
+import os
+
+from data_store import private_directory, user_temp_path
+
+logger = logging.getLogger(__name__)
+
+
+# Gestionnaire des tâches de fond, ou None si l'import doit rester synchrone
+def background_manager_from_env(store):
+    if os.environ.get('AMAZONKPI_BACKGROUND', '1') == '0':
+        return None
+    if store.directory is None:
+        logger.info("Datasets are kept in memory, uploads are ingested synchronously")
+        return None
+
+    try:
+        import diskcache
+        from dash import DiskcacheManager
+        directory = private_directory(os.environ.get('AMAZONKPI_JOBS_DIR', user_temp_path('amazonkpi-jobs')))
+        expire = float(os.environ.get('AMAZONKPI_JOBS_EXPIRE', '3600'))
+        return DiskcacheManager(diskcache.Cache(directory), expire=expire)
+    except ImportError:
+        logger.info("diskcache, multiprocess or psutil is not installed, uploads are ingested synchronously")
+        return None
@@ -0,0 +1,71 @@
+# Calcul vectorisé des KPIs (CTR / CVR) et de la stratégie par Search Query.
+#
+# Ce module ne dépend que de pandas / numpy : il est utilisable en dehors des
+# callbacks Dash (scripts, notebooks, traitements batch).
+import numpy as np
+import pandas as pd
+
+STRATEGIES = ["Improve CVR", "Improve CTR", "Improve Traffic", "Reduce Traffic"]
+STRATEGY_DTYPE = pd.CategoricalDtype(STRATEGIES)
+
+KPI_COLUMNS = ['Market_CTR', 'Brand_CTR', 'Δ_CTR', 'Market_CVR', 'Brand_CVR', 'Δ_CVR', 'strategy']
+
+
+# Division sûre : NaN lorsque le dénominateur est nul ou manquant (au lieu de inf)
+def safe_ratio(numerator, denominator):
+    num = np.asarray(numerator, dtype='float64')
+    den = np.asarray(denominator, dtype='float64')
+    out = np.full(num.shape, np.nan)
+    np.divide(num, den, out=out, where=(den != 0) & ~np.isnan(den))
+    return out
+
+
+# Δ utilisé pour la stratégie : division simple, comme l'ancien calcul. x / 0 vaut
+# +inf pour x > 0 (des achats de la marque sans clic de la marque comptent comme
+# un Δ positif) et NaN pour 0 / 0 ; seules les colonnes affichées passent par safe_ratio
+def _strategy_delta(num, den, market_num, market_den):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (np.asarray(num, dtype='float64') / np.asarray(den, dtype='float64')
+                - np.asarray(market_num, dtype='float64') / np.asarray(market_den, dtype='float64'))
+
+
+# Déterminer la stratégie pour des tableaux de Δ_CTR et Δ_CVR.
+# Les comparaisons avec NaN sont fausses : une ligne sans Δ valide tombe dans
+# "Reduce Traffic", comme avec l'ancienne fonction ligne par ligne.
+def strategy_from_deltas(delta_ctr, delta_cvr):
+    delta_ctr = np.asarray(delta_ctr, dtype='float64')
+    delta_cvr = np.asarray(delta_cvr, dtype='float64')
+    conditions = [
+        (delta_ctr > 0) & (delta_cvr < 0),
+        (delta_cvr > 0) & (delta_ctr < 0),
+        (delta_ctr > 0) & (delta_cvr > 0),
+    ]
+    # Codes des catégories de STRATEGIES ; 3 = "Reduce Traffic"
+    codes = np.select(conditions, [0, 1, 2], default=3).astype('int8')
+    return pd.Categorical.from_codes(codes, dtype=STRATEGY_DTYPE)
+
+
+# Ajouter les colonnes Market/Brand CTR et CVR, les Δ et la stratégie en une passe
+def compute_kpis(df, inplace=False):
+    if not inplace:
+        df = df.copy()
+
+    market_ctr = safe_ratio(df["Clicks: Total Count"], df["Impressions: Total Count"])
+    brand_ctr = safe_ratio(df["Clicks: Brand Count"], df["Impressions: Brand Count"])
+    market_cvr = safe_ratio(df["Purchases: Total Count"], df["Clicks: Total Count"])
+    brand_cvr = safe_ratio(df["Purchases: Brand Count"], df["Clicks: Brand Count"])
+    delta_ctr = brand_ctr - market_ctr
+    delta_cvr = brand_cvr - market_cvr
+
+    df['Market_CTR'] = market_ctr
+    df['Brand_CTR'] = brand_ctr
+    df['Δ_CTR'] = delta_ctr
+    df['Market_CVR'] = market_cvr
+    df['Brand_CVR'] = brand_cvr
+    df['Δ_CVR'] = delta_cvr
+    df['strategy'] = strategy_from_deltas(
+        _strategy_delta(df["Clicks: Brand Count"], df["Impressions: Brand Count"],
+                        df["Clicks: Total Count"], df["Impressions: Total Count"]),
+        _strategy_delta(df["Purchases: Brand Count"], df["Clicks: Brand Count"],
+                        df["Purchases: Total Count"], df["Clicks: Total Count"]))
+    return df
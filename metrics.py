@@ -0,0 +1,263 @@
+# Instrumentation des callbacks : latences, lignes traitées et taille des réponses.
+#
+# Les mesures sont gardées en mémoire dans le processus et exposées au format
+# texte de Prometheus (route /metrics de l'application). Avec plusieurs workers
+# gunicorn, chaque worker expose ses propres compteurs.
+#
+# La taille des réponses est celle du corps HTTP envoyé par Dash, relevée après
+# coup par un hook Flask (install_response_size) : aucune sérialisation en plus
+# dans le temps mesuré des callbacks.
+#
+# Un callback exécuté en tâche de fond tourne dans un autre processus : ses
+# mesures sont relevées par capture(), renvoyées avec son résultat et
+# enregistrées dans le processus web par replay().
+#
+# Variables d'environnement :
+#   AMAZONKPI_SLOW_CALLBACK_MS=500  journaliser les callbacks plus lents que ce seuil
+#   AMAZONKPI_PROFILE_DIR=/tmp/prof profiler les callbacks (cProfile) et enregistrer
+#                                   le profil de ceux qui dépassent le seuil
+import contextlib
+import contextvars
+import cProfile
+import functools
+import logging
+import math
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = (1e3, 1e4, 5e4, 1e5, 5e5, 1e6, 5e6, 1e7, 5e7)
+MEMORY_BUCKETS = (1e6, 5e6, 1e7, 5e7, 1e8, 2.5e8, 5e8, 1e9, 2.5e9, 5e9)
+
+_current_callback = contextvars.ContextVar('amazonkpi_callback', default='none')
+# Liste qui reçoit les mesures à la place du registre (voir capture), ou None
+_captured = contextvars.ContextVar('amazonkpi_captured', default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+        # Compteurs lus au moment de l'export (caches...) : nom -> fonction
+        self._collectors = {}
+
+    def observe(self, name, labels, value, buckets, help_text=''):
+        captured = _captured.get()
+        if captured is not None:
+            captured.append(['observe', name, dict(labels), value, list(buckets), help_text])
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+                self._help.setdefault(name, help_text)
+            histogram.observe(value)
+
+    def inc(self, name, labels, value=1, help_text=''):
+        captured = _captured.get()
+        if captured is not None:
+            captured.append(['inc', name, dict(labels), value, None, help_text])
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+            self._help.setdefault(name, help_text)
+
+    def register_collector(self, name, collect, help_text=''):
+        with self._lock:
+            self._collectors[name] = collect
+            self._help[name] = help_text
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    # Export au format texte de Prometheus (version 0.0.4)
+    def render(self):
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            collectors = sorted(self._collectors.items())
+            help_texts = dict(self._help)
+
+        seen = set()
+        for (name, labels), histogram in histograms:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {help_texts.get(name, '')}")
+                lines.append(f"# TYPE {name} histogram")
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                lines.append(f"{name}_bucket{_labels(labels, le=_number(bound))} {count}")
+            lines.append(f"{name}_bucket{_labels(labels, le='+Inf')} {histogram.count}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(histogram.sum)}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+
+        for (name, labels), value in counters:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {help_texts.get(name, '')}")
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_labels(labels)} {_number(value)}")
+
+        for name, collect in collectors:
+            value = collect()
+            if value is None:
+                continue
+            lines.append(f"# HELP {name} {help_texts.get(name, '')}")
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {_number(value)}")
+
+        return '\n'.join(lines) + '\n'
+
+
+def _number(value):
+    if isinstance(value, float) and math.isinf(value):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, **extra):
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in items) + '}'
+
+
+registry = Registry()
+
+
+# Relever les mesures prises dans le bloc au lieu de les enregistrer : la liste
+# produite (sérialisable en JSON) est enregistrée plus tard par replay, en
+# général dans un autre processus
+@contextlib.contextmanager
+def capture():
+    measurements = []
+    token = _captured.set(measurements)
+    try:
+        yield measurements
+    finally:
+        _captured.reset(token)
+
+
+# Enregistrer dans le registre les mesures relevées par capture
+def replay(measurements):
+    for kind, name, labels, value, buckets, help_text in measurements or []:
+        if kind == 'observe':
+            registry.observe(name, labels, value, tuple(buckets), help_text)
+        else:
+            registry.inc(name, labels, value, help_text)
+
+
+# Enregistrer la durée d'une étape du callback en cours
+def observe_stage(stage, seconds):
+    registry.observe('amazonkpi_stage_duration_seconds',
+                     {'callback': _current_callback.get(), 'stage': stage}, seconds, LATENCY_BUCKETS,
+                     "Duration of the internal stages of Dash callbacks")
+
+
+@contextlib.contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - start)
+
+
+# Ajouter des lignes traitées au compteur du callback en cours
+def add_rows(count):
+    registry.inc('amazonkpi_callback_rows_total', {'callback': _current_callback.get()}, int(count),
+                 "Rows processed by Dash callbacks")
+
+
+# Noter le callback de la requête en cours pour le hook de install_response_size
+def _tag_request(name):
+    try:
+        from flask import g, has_request_context
+    except ImportError:
+        return
+    if has_request_context():
+        g.amazonkpi_callback = name
+
+
+# Enregistrer la taille des réponses de /_dash-update-component, une fois
+# sérialisées par Dash, sous le nom du callback instrumenté qui les a produites
+def install_response_size(server):
+    from flask import g
+
+    @server.after_request
+    def record_response_size(response):
+        name = g.pop('amazonkpi_callback', None)
+        if name is not None and not response.is_streamed:
+            registry.observe('amazonkpi_callback_response_bytes', {'callback': name},
+                             response.calculate_content_length() or 0, BYTES_BUCKETS,
+                             "Serialized size of Dash callback responses")
+        return response
+
+
+# Décorateur des callbacks Dash : latence totale et, si activé, journal et
+# profil cProfile des appels lents
+def instrument(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            token = _current_callback.set(name)
+            _tag_request(name)
+            slow_ms = os.environ.get('AMAZONKPI_SLOW_CALLBACK_MS')
+            profile_dir = os.environ.get('AMAZONKPI_PROFILE_DIR') if slow_ms else None
+            profiler = cProfile.Profile() if profile_dir else None
+            status = 'error'
+            start = time.perf_counter()
+            try:
+                if profiler is not None:
+                    result = profiler.runcall(func, *args, **kwargs)
+                else:
+                    result = func(*args, **kwargs)
+                status = 'ok'
+                return result
+            finally:
+                elapsed = time.perf_counter() - start
+                registry.observe('amazonkpi_callback_duration_seconds', {'callback': name, 'status': status},
+                                 elapsed, LATENCY_BUCKETS, "Latency of Dash callbacks")
+                _current_callback.reset(token)
+                if slow_ms and elapsed * 1000 > float(slow_ms):
+                    _report_slow(name, elapsed, profiler, profile_dir)
+        return wrapper
+    return decorator
+
+
+def _report_slow(name, elapsed, profiler, profile_dir):
+    if profiler is None:
+        logger.warning("Slow callback %s: %.0f ms", name, elapsed * 1000)
+        return
+    os.makedirs(profile_dir, exist_ok=True)
+    path = os.path.join(profile_dir, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.prof")
+    profiler.dump_stats(path)
+    logger.warning("Slow callback %s: %.0f ms, profile written to %s", name, elapsed * 1000, path)
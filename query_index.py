@@ -0,0 +1,56 @@
+# Recherche des Search Query pour les dropdowns (search-as-you-type côté serveur).
+#
+# Construit à l'import : les queries classées par impressions décroissantes.
+# Une recherche renvoie au plus `limit` queries, d'abord celles qui commencent
+# par le texte saisi puis celles qui le contiennent, chaque groupe par
+# impressions décroissantes. La réponse envoyée au navigateur ne dépend que de
+# `limit`, pas du nombre de queries importées.
+import bisect
+
+import numpy as np
+
+
+class QueryIndex:
+    def __init__(self, queries, impressions):
+        order = np.argsort(-np.asarray(impressions, dtype='float64'), kind='stable')
+        # Rang (0 = plus d'impressions) -> query
+        self._queries = [str(queries[i]) for i in order]
+        lowered = [query.lower().replace('\n', ' ') for query in self._queries]
+
+        # Préfixes : queries en minuscules triées alphabétiquement, avec leur rang
+        alphabetical = sorted(range(len(lowered)), key=lowered.__getitem__)
+        self._sorted = [lowered[rank] for rank in alphabetical]
+        self._sorted_ranks = np.array(alphabetical, dtype='int64')
+
+        # Sous-chaînes : toutes les queries par rang dans un seul texte, une par ligne.
+        # str.find parcourt ce texte dans l'ordre des rangs : les premiers résultats
+        # sont les queries les mieux classées
+        self._text = '\n'.join(lowered) + '\n'
+        self._starts = np.cumsum([0] + [len(query) + 1 for query in lowered], dtype='int64')
+
+    def __len__(self):
+        return len(self._queries)
+
+    def search(self, text, limit=50):
+        text = (text or '').lower()
+        if not text:
+            return self._queries[:limit]
+
+        lo = bisect.bisect_left(self._sorted, text)
+        hi = bisect.bisect_left(self._sorted, text + chr(0x10ffff))
+        ranks = self._sorted_ranks[lo:hi]
+        if len(ranks) > limit:
+            ranks = np.partition(ranks, limit - 1)[:limit]
+        found = [int(rank) for rank in np.sort(ranks)]
+
+        taken = set(found)
+        position = self._text.find(text) if '\n' not in text else -1
+        while position != -1 and len(found) < limit:
+            rank = int(np.searchsorted(self._starts, position, side='right')) - 1
+            if rank not in taken:
+                found.append(rank)
+                taken.add(rank)
+            # Reprendre à la query suivante : une seule occurrence par query
+            position = self._text.find(text, self._starts[rank + 1])
+
+        return [self._queries[rank] for rank in found]
@@ -0,0 +1,164 @@
+# Pagination, tri et filtrage côté serveur pour la table des données brutes.
+#
+# Le navigateur n'affiche qu'une page : le filtrage et le tri sont faits ici en
+# pandas, et l'ordre obtenu (positions des lignes) est mis en cache pour que le
+# changement de page ne coûte qu'un iloc sur page_size lignes.
+#
+# Avec `decimals`, les flottants sont affichés arrondis et les filtres comparent
+# ces valeurs affichées ; le tri se fait sur les valeurs exactes.
+import math
+
+import numpy as np
+import pandas as pd
+
+from data_store import LRUCache
+from dataset import widen, widen_values
+
+DATE_COLUMNS = ['Reporting Date']
+
+# Opérateurs de la syntaxe filter_query de dash_table
+OPERATORS = [['ge ', '>='],
+             ['le ', '<='],
+             ['lt ', '<'],
+             ['gt ', '>'],
+             ['ne ', '!='],
+             ['eq ', '='],
+             ['contains '],
+             ['datestartswith ']]
+
+_order_cache = LRUCache(maxsize=32)
+
+
+# Découper une expression "{colonne} op valeur" (cf. documentation dash_table)
+def split_filter_part(filter_part):
+    for operator_type in OPERATORS:
+        for operator in operator_type:
+            if operator in filter_part:
+                name_part, value_part = filter_part.split(operator, 1)
+                name = name_part[name_part.find('{') + 1: name_part.rfind('}')]
+
+                value_part = value_part.strip()
+                v0 = value_part[0] if value_part else ''
+                if v0 and v0 == value_part[-1] and v0 in ("'", '"', '`'):
+                    value = value_part[1: -1].replace('\\' + v0, v0)
+                else:
+                    try:
+                        value = float(value_part)
+                    except ValueError:
+                        value = value_part
+
+                # Le mot-clé est renvoyé sans espace ("contains", "datestartswith")
+                return name, operator_type[0].strip(), value
+
+    return [None] * 3
+
+
+# Évaluer une condition sur les valeurs distinctes puis la propager aux lignes :
+# bien plus rapide que de convertir chaque ligne en texte (catégories, dates)
+def _mask_on_uniques(series, condition):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes, uniques = series.cat.codes.to_numpy(), pd.Series(series.cat.categories)
+    else:
+        codes, uniques = pd.factorize(series)
+        uniques = pd.Series(uniques)
+    unique_mask = np.append(np.asarray(condition(uniques), dtype=bool), False)
+    # Le code -1 (valeur manquante) pointe sur le False ajouté en fin de tableau
+    return unique_mask[codes]
+
+
+# Masque booléen d'une condition sur une colonne
+def _condition_mask(series, operator, value, decimals=None):
+    if operator == 'contains':
+        return _mask_on_uniques(
+            series, lambda u: u.astype(str).str.contains(str(value), case=False, regex=False))
+
+    if operator == 'datestartswith':
+        if series.name in DATE_COLUMNS:
+            return _mask_on_uniques(
+                series, lambda u: u.dt.strftime('%Y-%m-%d').str.startswith(str(value)))
+        return _mask_on_uniques(series, lambda u: u.astype(str).str.startswith(str(value)))
+
+    if series.name in DATE_COLUMNS:
+        value = pd.to_datetime(str(value), errors='coerce')
+        if pd.isna(value):
+            return np.zeros(len(series), dtype=bool)
+    elif isinstance(series.dtype, pd.CategoricalDtype) or series.dtype == object:
+        value = str(value) if not isinstance(value, float) else f"{value:g}"
+        return _mask_on_uniques(series, lambda u: _compare(u.astype(str), operator, value))
+    else:
+        # Colonne numérique : une valeur qui n'est pas un nombre ne retient aucune ligne
+        value = pd.to_numeric(value, errors='coerce')
+        if pd.isna(value):
+            return np.zeros(len(series), dtype=bool)
+        if decimals is not None and pd.api.types.is_float_dtype(series.dtype):
+            series = np.round(widen_values(series.to_numpy()), decimals)
+
+    return np.asarray(_compare(series, operator, value), dtype=bool)
+
+
+def _compare(series, operator, value):
+    if operator == 'eq':
+        return series == value
+    if operator == 'ne':
+        return series != value
+    if operator == 'lt':
+        return series < value
+    if operator == 'le':
+        return series <= value
+    if operator == 'gt':
+        return series > value
+    return series >= value
+
+
+# Positions des lignes retenues par filter_query, dans l'ordre de sort_by
+def filtered_order(df, filter_query, sort_by, decimals=None):
+    positions = np.arange(len(df))
+
+    if filter_query:
+        mask = np.ones(len(df), dtype=bool)
+        for filter_part in filter_query.split(' && '):
+            col_name, operator, filter_value = split_filter_part(filter_part)
+            if col_name not in df.columns:
+                continue
+            mask &= _condition_mask(df[col_name], operator, filter_value, decimals)
+        positions = np.flatnonzero(mask)
+
+    if sort_by:
+        columns = [col['column_id'] for col in sort_by if col['column_id'] in df.columns]
+        ascending = [col['direction'] == 'asc' for col in sort_by if col['column_id'] in df.columns]
+        if columns:
+            subset = df[columns].iloc[positions]
+            subset.index = positions
+            positions = subset.sort_values(
+                columns, ascending=ascending, kind='stable', na_position='last').index.to_numpy()
+
+    return positions
+
+
+# Calculer uniquement la page visible : (lignes, nombre de pages)
+def table_page(df, page_current, page_size, sort_by=None, filter_query=None, cache_key=None, decimals=None):
+    page_current = page_current or 0
+    sort_key = tuple((col['column_id'], col['direction']) for col in sort_by or [])
+
+    key = (cache_key, filter_query or '', sort_key)
+    positions = _order_cache.get(key) if cache_key is not None else None
+    if positions is None:
+        positions = filtered_order(df, filter_query, sort_by, decimals)
+        if cache_key is not None:
+            _order_cache.put(key, positions)
+
+    page_count = max(1, math.ceil(len(positions) / page_size))
+    start = page_current * page_size
+    page = df.iloc[positions[start: start + page_size]].copy()
+
+    for col in DATE_COLUMNS:
+        if col in page.columns:
+            page[col] = page[col].dt.strftime('%Y-%m-%d')
+
+    # float32 du jeu de données compact : renvoyer 12.3 et non 12.300000190734863
+    page = widen(page)
+    if decimals is not None:
+        floats = [col for col in page.columns if pd.api.types.is_float_dtype(page[col].dtype)]
+        page = page.round({col: decimals for col in floats})
+
+    return page.to_dict('records'), page_count
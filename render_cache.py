@@ -0,0 +1,43 @@
+# Cache des rendus de l'onglet "Focus on a Keyword".
+#
+# Les cartes KPI, le funnel et le graphique des Δ sont mémorisés par
+# (version du jeu de données, Search Query, date). La version est la clé du
+# jeu de données dans le stockage serveur : un nouvel upload en crée une
+# nouvelle, et les rendus de l'ancienne sont invalidés.
+import os
+
+from data_store import LRUCache
+
+
+class RenderCache:
+    def __init__(self, maxsize=256):
+        self._cache = LRUCache(maxsize)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, version, query, date):
+        value = self._cache.get((version, query, date))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, version, query, date, value):
+        self._cache.put((version, query, date), value)
+
+    # Supprimer tous les rendus d'une version du jeu de données
+    def invalidate(self, version):
+        for key in self._cache.keys():
+            if key[0] == version:
+                self._cache.pop(key)
+
+    def clear(self):
+        self._cache.clear()
+
+    def __len__(self):
+        return len(self._cache)
+
+
+def render_cache_from_env():
+    return RenderCache(maxsize=int(os.environ.get('AMAZONKPI_RENDER_CACHE_SIZE', '256')))
@@ -0,0 +1,152 @@
+# Cache adressé par contenu des rapports déjà importés.
+#
+# Chaque fichier envoyé est identifié par l'empreinte de ses octets. Le DataFrame
+# lu, typé et enrichi des KPIs est enregistré au format Arrow IPC (non compressé)
+# sous cette empreinte : un nouvel envoi des mêmes octets est relu par memory-map
+# sans repasser par le parseur CSV. La taille totale du cache est bornée et les
+# fichiers les moins récemment utilisés sont supprimés en premier.
+#
+# Un rapport en cache est servi à la place du fichier envoyé : comme pour
+# data_store, le dossier est privé (0700) et propre à l'utilisateur, et un
+# fichier qui ne lui appartient pas n'est jamais relu.
+#
+# Nécessite pyarrow ; sans lui le cache est simplement désactivé.
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+
+from data_store import private_directory, user_temp_path
+
+logger = logging.getLogger(__name__)
+
+# À incrémenter lorsque la lecture ou le calcul des KPIs change : les entrées
+# produites par une version précédente ne sont alors plus retrouvées
+CACHE_FORMAT = b'amazonkpi-report-v2'
+
+
+def digest(data):
+    h = hashlib.blake2b(CACHE_FORMAT, digest_size=20)
+    h.update(data)
+    return h.hexdigest()
+
+
+class ReportCache:
+    def __init__(self, directory, max_bytes=2 * 1024 ** 3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        private_directory(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.arrow")
+
+    # Entrée présente et écrite par l'utilisateur courant
+    def _owned(self, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return False
+        if hasattr(os, 'getuid') and st.st_uid != os.getuid():
+            logger.warning("Ignoring %s: not owned by the current user", path)
+            return False
+        return True
+
+    def __contains__(self, key):
+        return self._owned(self._path(key))
+
+    # Relire un rapport par memory-map ; None s'il n'est pas (ou plus) en cache
+    def load(self, key):
+        from pyarrow import feather
+
+        path = self._path(key)
+        if not self._owned(path):
+            return None
+        try:
+            table = feather.read_table(path, memory_map=True)
+        except (FileNotFoundError, OSError):
+            return None
+        # Rafraîchir la date d'utilisation pour l'éviction LRU
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return table.to_pandas(split_blocks=True)
+
+    # Enregistrer un rapport de façon atomique puis appliquer la limite de taille
+    def save(self, key, df):
+        import pyarrow as pa
+        from pyarrow import feather
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        os.close(fd)
+        try:
+            feather.write_feather(pa.Table.from_pandas(df, preserve_index=False),
+                                  tmp_path, compression='uncompressed')
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict()
+
+    # Supprimer les entrées les moins récemment utilisées au-delà de max_bytes
+    def evict(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith('.arrow'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+_report_cache = None
+_pyarrow_missing = False
+_report_cache_lock = threading.Lock()
+
+
+# Cache par défaut, configuré par variables d'environnement ; None si désactivé
+def get_report_cache():
+    global _report_cache, _pyarrow_missing
+    if _pyarrow_missing or os.environ.get('AMAZONKPI_REPORT_CACHE', '1') == '0':
+        return None
+    with _report_cache_lock:
+        if _report_cache is None:
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                logger.info("pyarrow is not installed, the report cache is disabled")
+                _pyarrow_missing = True
+                return None
+            directory = os.environ.get('AMAZONKPI_REPORT_CACHE_DIR', user_temp_path('amazonkpi-reports'))
+            max_mb = float(os.environ.get('AMAZONKPI_REPORT_CACHE_MAX_MB', '2048'))
+            _report_cache = ReportCache(directory, max_bytes=int(max_mb * 1024 ** 2))
+        return _report_cache
@@ -0,0 +1,188 @@
+# Cube d'agrégats (rollup) pour l'onglet "Portfolio".
+#
+# Construit une fois à l'import : les comptages (impressions, clics, paniers,
+# achats ; total et marque) sommés par Search Query x semaine / mois / trimestre,
+# ainsi que le total toutes queries confondues par période. Une vue sur une
+# plage de dates ne lit que ces sommes : son coût dépend du nombre de queries
+# choisies et de périodes, pas du nombre de lignes importées.
+#
+# Les CTR / CVR et les Δ sont recalculés à partir des comptages sommés
+# (compute_kpis), jamais moyennés d'une query ou d'une semaine à l'autre.
+import numpy as np
+import pandas as pd
+
+from kpi import compute_kpis
+
+COUNT_COLUMNS = [
+    'Impressions: Total Count', 'Impressions: Brand Count',
+    'Clicks: Total Count', 'Clicks: Brand Count',
+    'Basket Adds: Total Count', 'Basket Adds: Brand Count',
+    'Purchases: Total Count', 'Purchases: Brand Count',
+]
+
+GRAINS = ['week', 'month', 'quarter']
+_FREQUENCIES = {'month': 'M', 'quarter': 'Q'}
+
+
+# Début de la période (semaine, mois ou trimestre) de chaque date. Une semaine
+# est rattachée au mois / trimestre de sa Reporting Date
+def period_start(dates, grain):
+    dates = pd.DatetimeIndex(dates)
+    if grain == 'week':
+        return dates
+    return dates.to_period(_FREQUENCIES[grain]).start_time
+
+
+# Dernier jour de chaque période commençant à `periods`
+def period_last_day(periods, grain):
+    periods = pd.DatetimeIndex(periods)
+    if grain == 'week':
+        return periods
+    return periods.to_period(_FREQUENCIES[grain]).end_time.normalize()
+
+
+# Libellés des périodes : 2024-01-06, 2024-01 ou 2024Q1
+def period_labels(periods, grain):
+    periods = pd.DatetimeIndex(periods)
+    if grain == 'week':
+        return list(periods.strftime('%Y-%m-%d'))
+    return list(periods.to_period(_FREQUENCIES[grain]).astype(str))
+
+
+# Sommes stockées en int32 lorsqu'elles y tiennent ; les additions se font en int64
+def _downcast(values):
+    if len(values) == 0 or values.max() < np.iinfo('int32').max:
+        return values.astype('int32')
+    return values
+
+
+# Sommer les comptages par (query, période). Retourne (codes des queries, codes
+# des périodes, sommes), triés par query puis par période
+def _sum_by_key(codes, period_codes, n_periods, counts):
+    keys = codes * n_periods + period_codes
+    if len(keys) < 2:
+        return codes, period_codes, counts
+    if not (keys[1:] >= keys[:-1]).all():
+        order = np.argsort(keys, kind='stable')
+        keys, counts = keys[order], counts[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    if len(starts) < len(keys):
+        # Doublons (query, période) : additionner les lignes de chaque groupe
+        counts = np.add.reduceat(counts, starts, axis=0)
+        keys = keys[starts]
+    return keys // n_periods, keys % n_periods, counts
+
+
+class RollupCube:
+    def __init__(self, df):
+        queries = df['Search Query']
+        if not isinstance(queries.dtype, pd.CategoricalDtype):
+            queries = queries.astype('category')
+        self.queries = queries.cat.categories
+
+        codes = queries.cat.codes.to_numpy()
+        dates = df['Reporting Date'].to_numpy(dtype='datetime64[ns]')
+        valid = (codes >= 0) & ~np.isnat(dates)
+        codes, dates = codes[valid], dates[valid]
+        counts = df[COUNT_COLUMNS].fillna(0).to_numpy(dtype='int64')[valid]
+
+        # Semaines : sommes par (query, Reporting Date). Mois et trimestres : sommes
+        # des semaines, déjà triées par query puis par date
+        week_values, week_codes = np.unique(dates, return_inverse=True)
+        codes, week_codes, counts = _sum_by_key(codes.astype('int64'), week_codes, len(week_values), counts)
+        self._grains = {'week': self._grain(week_values, codes, week_codes, counts)}
+        for grain in GRAINS[1:]:
+            period_values, period_of_week = np.unique(period_start(week_values, grain), return_inverse=True)
+            self._grains[grain] = self._grain(period_values, *_sum_by_key(
+                codes, period_of_week[week_codes], len(period_values), counts))
+
+    def _grain(self, period_values, codes, period_codes, counts):
+        totals = pd.DataFrame(counts).groupby(period_codes, sort=True).sum()
+        return {
+            'periods': period_values,
+            'period_codes': period_codes.astype('int32'),
+            'values': _downcast(counts),
+            # Lignes de la query c : offsets[c]:offsets[c + 1]
+            'offsets': np.searchsorted(codes, np.arange(len(self.queries) + 1)),
+            'totals': totals.to_numpy(),
+        }
+
+    def nbytes(self):
+        return sum(array.nbytes for grain in self._grains.values() for array in grain.values())
+
+    # Périodes disponibles (débuts de semaine / mois / trimestre), triées
+    def periods(self, grain):
+        return self._grains[grain]['periods']
+
+    # Comptages sommés par période pour une liste de queries (toutes si elle est
+    # vide), et périodes où au moins une de ces queries a un rapport
+    def _values(self, grain, queries):
+        cube = self._grains[grain]
+        periods = cube['periods']
+        if not queries:
+            return cube['totals'].astype('int64'), np.ones(len(periods), dtype=bool)
+
+        codes = self.queries.get_indexer(queries)
+        offsets = cube['offsets']
+        rows = [np.arange(offsets[code], offsets[code + 1]) for code in codes[codes >= 0]]
+        rows = np.concatenate(rows) if rows else np.empty(0, dtype='int64')
+        period_codes = cube['period_codes'][rows]
+        values = np.zeros((len(periods), len(COUNT_COLUMNS)), dtype='int64')
+        np.add.at(values, period_codes, cube['values'][rows])
+        present = np.bincount(period_codes, minlength=len(periods)) > 0
+        return values, present
+
+    # Comptages sommés et KPIs par période sur [start, end], pour une liste de
+    # queries (toutes si elle est vide). Un mois / trimestre entièrement compris
+    # dans la plage est lu dans son cube ; celui qui n'y est qu'en partie (au
+    # plus un à chaque bord) est recalculé à partir des seules semaines de la
+    # plage et marqué Partial. Les sommes ne dépendent donc pas du grain
+    def series(self, grain, queries=None, start=None, end=None):
+        periods = self._grains[grain]['periods']
+        values, present = self._values(grain, queries)
+
+        start = pd.Timestamp(start).to_datetime64() if start is not None else None
+        end = pd.Timestamp(end).to_datetime64() if end is not None else None
+        last_days = period_last_day(periods, grain).to_numpy()
+        inside = np.ones(len(periods), dtype=bool)
+        overlaps = np.ones(len(periods), dtype=bool)
+        if start is not None:
+            inside &= periods >= start
+            overlaps &= last_days >= start
+        if end is not None:
+            inside &= last_days <= end
+            overlaps &= periods <= end
+        partial = overlaps & ~inside
+
+        if partial.any():
+            weeks = self._grains['week']['periods']
+            week_values, week_present = self._values('week', queries)
+            in_range = week_present.copy()
+            if start is not None:
+                in_range &= weeks >= start
+            if end is not None:
+                in_range &= weeks <= end
+            period_of_week = np.searchsorted(periods, period_start(weeks, grain).to_numpy())
+            values = values.copy()
+            for position in np.flatnonzero(partial):
+                weeks_in = in_range & (period_of_week == position)
+                values[position] = week_values[weeks_in].sum(axis=0)
+                present[position] = weeks_in.any()
+
+        present &= overlaps
+        frame = pd.DataFrame(values[present], columns=COUNT_COLUMNS)
+        frame.insert(0, 'Period', periods[present])
+        frame['Partial'] = partial[present]
+        frame = compute_kpis(frame, inplace=True)
+
+        # Comparaison avec la période précédente de la plage
+        frame['Δ_CTR vs previous'] = frame['Δ_CTR'].diff()
+        frame['Δ_CVR vs previous'] = frame['Δ_CVR'].diff()
+        return frame
+
+    # Totaux de la plage (une ligne), KPIs recalculés sur les comptages sommés :
+    # égaux à la somme des semaines de la plage, quel que soit le grain
+    def total(self, grain, queries=None, start=None, end=None):
+        frame = self.series(grain, queries, start, end)
+        totals = frame[COUNT_COLUMNS].sum().to_frame().T.astype('int64')
+        return compute_kpis(totals, inplace=True).iloc[0]
@@ -0,0 +1,19 @@
+# Les modules de l'application sont à la racine du dépôt (pas de paquet) ; le
+# générateur de rapports synthétiques est dans benchmarks/
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+
+# DataFrame combiné et enrichi des KPIs, comme après update_table
+@pytest.fixture
+def report_frame():
+    from generate_reports import generate_frame
+    from kpi import compute_kpis
+
+    return compute_kpis(generate_frame(60, 10, seed=3))
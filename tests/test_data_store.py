@@ -0,0 +1,38 @@
+import os
+import time
+
+import pytest
+
+from data_store import DatasetStore
+
+
+def test_put_get_roundtrip(tmp_path):
+    store = DatasetStore(directory=str(tmp_path / 'store'))
+    key = store.put({'rows': 3})
+    assert store.get(key) == {'rows': 3}
+    # Autre worker : relu depuis le disque
+    assert DatasetStore(directory=str(tmp_path / 'store')).get(key) == {'rows': 3}
+    assert store.get('not-a-key') is None
+
+
+@pytest.mark.skipif(not hasattr(os, 'getuid'), reason="POSIX permissions")
+def test_directory_is_private(tmp_path):
+    directory = tmp_path / 'store'
+    directory.mkdir(mode=0o777)
+    os.chmod(directory, 0o777)
+    DatasetStore(directory=str(directory))
+    assert os.stat(directory).st_mode & 0o777 == 0o700
+
+
+def test_memory_hit_refreshes_mtime(tmp_path):
+    store = DatasetStore(directory=str(tmp_path / 'store'), max_age=60)
+    key = store.put({'rows': 3})
+    path = store._path(key)
+    os.utime(path, (0, 0))
+
+    assert store.get(key) is not None
+    assert os.stat(path).st_mtime > time.time() - 60
+
+    # Le jeu de données consulté survit à la purge des autres workers
+    store._purge_expired()
+    assert os.path.exists(path)
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dataset import Dataset, for_display, widen
+from generate_reports import generate_frame
+from kpi import compute_kpis
+
+KEY = ['Search Query', 'Reporting Date']
+
+
+def _sorted(df):
+    df = widen(df).astype({'Search Query': str, 'strategy': str})
+    return df.sort_values(KEY, kind='stable').reset_index(drop=True)
+
+
+@pytest.fixture
+def uploads():
+    frame = compute_kpis(generate_frame(80, 9, seed=5))
+    dates = sorted(frame['Reporting Date'].unique())
+    old = frame[frame['Reporting Date'].isin(dates[:6])]
+
+    # Nouvel envoi : deux semaines nouvelles, une semaine déjà importée avec des
+    # comptages corrigés (plus grands que l'int16 d'origine) et des queries inconnues
+    new = frame[frame['Reporting Date'].isin(dates[5:8])].copy()
+    corrected = new['Reporting Date'] == dates[5]
+    new.loc[corrected, 'Impressions: Total Count'] += 100000
+    extra = frame[frame['Reporting Date'] == dates[8]].head(5).copy()
+    extra['Search Query'] = [f"new query {i}" for i in range(len(extra))]
+    extra['Δ_CTR'] = 1e6
+    new = compute_kpis(pd.concat([new, extra], ignore_index=True))
+    return old, new
+
+
+def test_append_matches_full_rebuild(uploads):
+    old, new = uploads
+    appended = Dataset(old).append(new)
+    rebuilt = Dataset(pd.concat([old, new]).drop_duplicates(KEY, keep='last'))
+
+    pd.testing.assert_frame_equal(_sorted(appended.df), _sorted(rebuilt.df), check_dtype=False)
+    assert len(appended) == len(rebuilt)
+
+    # Index, recherche, cube et alertes identiques
+    for query in ['new query 0', old['Search Query'].iloc[0]]:
+        assert appended.search.search(query[:5]) == rebuilt.search.search(query[:5])
+        pd.testing.assert_frame_equal(_sorted(appended.series(query)), _sorted(rebuilt.series(query)),
+                                      check_dtype=False)
+    date = new['Reporting Date'].iloc[0]
+    row = appended.row(new['Search Query'].iloc[0], date)
+    assert row['Impressions: Total Count'] == new['Impressions: Total Count'].iloc[0]
+
+    for grain in ['week', 'month']:
+        pd.testing.assert_frame_equal(appended.rollup.series(grain), rebuilt.rollup.series(grain))
+    pd.testing.assert_frame_equal(_sorted(appended.alerts), _sorted(rebuilt.alerts), check_dtype=False)
+
+
+def test_append_does_not_modify_the_original(uploads):
+    old, new = uploads
+    dataset = Dataset(old)
+    before = dataset.df.copy()
+    dataset.append(new)
+    pd.testing.assert_frame_equal(dataset.df, before)
+
+
+def test_find_positions_first_duplicate_and_missing(uploads):
+    old, _ = uploads
+    dataset = Dataset(old)
+    queries = [old['Search Query'].iloc[3], old['Search Query'].iloc[3], "unknown"]
+    dates = old['Reporting Date'].iloc[[3, 3, 3]].to_numpy(dtype='datetime64[ns]').view('int64')
+    positions = dataset._find_positions(queries, dates)
+
+    assert positions.tolist()[2] == -1
+    assert positions[0] == positions[1] == dataset._position(queries[0], dates[0])
+    assert np.array_equal(dataset._find_positions([], np.empty(0, dtype='int64')), [])
+
+
+# Les valeurs gardées ne sont pas arrondies : KPIs exacts, taux et prix retrouvés
+# à l'identique, et alertes identiques à celles de batch.py --alerts
+def test_dataset_keeps_exact_values(report_frame):
+    from trends import alerts, compute_trends
+
+    dataset = Dataset(report_frame)
+    for col in ['Δ_CTR', 'Δ_CVR', 'Market_CTR', 'Brand_CVR']:
+        assert dataset.df[col].dtype == 'float64'
+        np.testing.assert_array_equal(dataset.df[col], report_frame[col])
+    assert dataset.df['Clicks: Price (Median)'].dtype == 'float32'
+    np.testing.assert_array_equal(widen(dataset.df)['Clicks: Price (Median)'], report_frame['Clicks: Price (Median)'])
+
+    expected = alerts(compute_trends(report_frame))
+    pd.testing.assert_frame_equal(dataset.alerts, expected, check_dtype=False, check_categorical=False)
+
+
+def test_for_display_rounds_like_the_original_upload(report_frame):
+    dataset = Dataset(report_frame)
+    query = dataset.queries[0]
+    expected = report_frame[report_frame['Search Query'] == query].sort_values('Reporting Date').round(1)
+
+    shown = for_display(dataset.series(query))
+    np.testing.assert_array_equal(shown['Δ_CTR'], expected['Δ_CTR'])
+    np.testing.assert_array_equal(shown['Clicks: Click Rate %'], expected['Clicks: Click Rate %'])
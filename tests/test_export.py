@@ -0,0 +1,141 @@
+import io
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dataset import Dataset, widen
+from export import export_chunks
+from kpi import KPI_COLUMNS
+
+pa = pytest.importorskip('pyarrow')
+
+
+@pytest.fixture
+def dataset(report_frame):
+    return Dataset(report_frame)
+
+
+def _export(dataset, positions, fmt, chunk_rows=97):
+    return b''.join(export_chunks(dataset.df, positions, fmt, chunk_rows=chunk_rows))
+
+
+# Lignes attendues : valeurs affichées (float32 élargis), sans index ni catégories
+def _expected(dataset, positions):
+    df = widen(dataset.df.iloc[positions]).reset_index(drop=True)
+    return df.astype({'Search Query': object, 'strategy': object})
+
+
+# Types relus d'un export Parquet / Arrow : schéma fixe, quels que soient les types compacts
+def _expected_typed(dataset, positions):
+    df = widen(dataset.df.iloc[positions]).reset_index(drop=True)
+    types = {}
+    for col, dtype in df.dtypes.items():
+        if pd.api.types.is_integer_dtype(dtype):
+            types[col] = 'int64'
+        elif pd.api.types.is_float_dtype(dtype):
+            types[col] = 'float64'
+    return df.astype(types)
+
+
+def _read(data, fmt):
+    import pyarrow.parquet as pq
+
+    if fmt == 'parquet':
+        return pq.read_table(io.BytesIO(data))
+    return pa.ipc.open_stream(data).read_all()
+
+
+def _positions(dataset):
+    queries = dataset.queries[:3]
+    dates = sorted(dataset.df['Reporting Date'].unique())
+    return dataset.select(queries, dates[2], dates[7])
+
+
+@pytest.mark.parametrize('select', [False, True])
+def test_csv_round_trip(dataset, select):
+    positions = _positions(dataset) if select else np.arange(len(dataset))
+    data = _export(dataset, positions, 'csv')
+    result = pd.read_csv(io.BytesIO(data), parse_dates=['Reporting Date'])
+
+    expected = _expected(dataset, positions)
+    assert list(result.columns) == list(dataset.df.columns)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def test_csv_round_trip_without_pyarrow(dataset, monkeypatch):
+    positions = _positions(dataset)
+    with_pyarrow = _export(dataset, positions, 'csv')
+    # Import de pyarrow impossible : écriture par pandas
+    for name in ('pyarrow', 'pyarrow.compute', 'pyarrow.csv'):
+        monkeypatch.setitem(sys.modules, name, None)
+    data = _export(dataset, positions, 'csv')
+
+    result = pd.read_csv(io.BytesIO(data), parse_dates=['Reporting Date'])
+    pd.testing.assert_frame_equal(result, _expected(dataset, positions), check_dtype=False)
+    assert data.splitlines()[0] == with_pyarrow.splitlines()[0]
+
+
+@pytest.mark.parametrize('select', [False, True])
+def test_parquet_round_trip(dataset, select):
+    import pyarrow.parquet as pq
+
+    positions = _positions(dataset) if select else np.arange(len(dataset))
+    data = _export(dataset, positions, 'parquet')
+    table = pq.read_table(io.BytesIO(data))
+    # Un row group par tranche de 97 lignes
+    assert pq.ParquetFile(io.BytesIO(data)).num_row_groups == -(-len(positions) // 97)
+
+    result = table.to_pandas()
+    pd.testing.assert_frame_equal(result, _expected_typed(dataset, positions), check_categorical=False)
+
+
+@pytest.mark.parametrize('select', [False, True])
+def test_arrow_stream_round_trip(dataset, select):
+    positions = _positions(dataset) if select else np.arange(len(dataset))
+    table = pa.ipc.open_stream(_export(dataset, positions, 'arrow')).read_all()
+
+    result = table.to_pandas()
+    pd.testing.assert_frame_equal(result, _expected_typed(dataset, positions), check_categorical=False)
+
+
+@pytest.mark.parametrize('fmt', ['parquet', 'arrow'])
+def test_schema_does_not_depend_on_the_compact_types(report_frame, fmt):
+    small = report_frame.copy()
+    small['Search Query Score'] = 1
+    small['Search Query Volume'] = small['Search Query Volume'] % 100
+    small[KPI_COLUMNS[:-1]] = small[KPI_COLUMNS[:-1]].round(2)
+    datasets = [Dataset(report_frame), Dataset(small)]
+    # Les types compacts diffèrent d'un import à l'autre…
+    assert not datasets[0].df.dtypes.equals(datasets[1].df.dtypes)
+
+    # …mais pas le schéma exporté
+    schemas = [_read(_export(d, np.arange(len(d)), fmt), fmt).schema for d in datasets]
+    assert schemas[0].equals(schemas[1])
+    types = dict(zip(schemas[0].names, schemas[0].types))
+    assert types['Search Query Score'] == pa.int64()
+    assert types['Search Query'] == pa.dictionary(pa.int32(), pa.string())
+    assert all(types[col] == pa.float64() for col in KPI_COLUMNS[:-1])
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'parquet', 'arrow'])
+def test_export_keeps_exact_kpis(dataset, report_frame, fmt):
+    data = _export(dataset, np.arange(len(dataset)), fmt)
+    if fmt == 'csv':
+        result = pd.read_csv(io.BytesIO(data), parse_dates=['Reporting Date'])
+    else:
+        result = _read(data, fmt).to_pandas()
+
+    key = ['Search Query', 'Reporting Date']
+    result = result.astype({'Search Query': object}).sort_values(key).reset_index(drop=True)
+    expected = report_frame.sort_values(key).reset_index(drop=True)
+    pd.testing.assert_frame_equal(result[KPI_COLUMNS[:-1]], expected[KPI_COLUMNS[:-1]])
+
+
+def test_empty_selection_keeps_the_schema(dataset):
+    positions = np.empty(0, dtype='int64')
+    assert pd.read_csv(io.BytesIO(_export(dataset, positions, 'csv'))).columns.tolist() == \
+        list(dataset.df.columns)
+    table = pa.ipc.open_stream(_export(dataset, positions, 'arrow')).read_all()
+    assert table.num_rows == 0 and table.column_names == list(dataset.df.columns)
@@ -0,0 +1,26 @@
+import os
+
+import pytest
+
+from data_store import DatasetStore
+from jobs import background_manager_from_env
+
+pytest.importorskip('diskcache')
+
+
+@pytest.mark.skipif(not hasattr(os, 'getuid'), reason="POSIX permissions")
+def test_jobs_directory_is_private(tmp_path, monkeypatch):
+    directory = tmp_path / 'jobs'
+    directory.mkdir(mode=0o777)
+    os.chmod(directory, 0o777)
+    monkeypatch.setenv('AMAZONKPI_BACKGROUND', '1')
+    monkeypatch.setenv('AMAZONKPI_JOBS_DIR', str(directory))
+
+    manager = background_manager_from_env(DatasetStore(directory=str(tmp_path / 'store')))
+    assert manager is not None
+    assert os.stat(directory).st_mode & 0o777 == 0o700
+
+
+def test_memory_store_keeps_imports_synchronous(monkeypatch):
+    monkeypatch.setenv('AMAZONKPI_BACKGROUND', '1')
+    assert background_manager_from_env(DatasetStore()) is None
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+from kpi import STRATEGIES, compute_kpis, safe_ratio, strategy_from_deltas
+
+
+# Ancienne fonction appliquée ligne par ligne (first.py avant le calcul vectorisé)
+def define_strategy(row):
+    if row['Δ_CTR'] > 0 and row['Δ_CVR'] < 0:
+        return "Improve CVR"
+    elif row['Δ_CVR'] > 0 and row['Δ_CTR'] < 0:
+        return "Improve CTR"
+    elif row['Δ_CTR'] > 0 and row['Δ_CVR'] > 0:
+        return "Improve Traffic"
+    else:
+        return "Reduce Traffic"
+
+
+def test_strategy_matches_row_by_row_logic():
+    values = [-1.0, -0.5, 0.0, 0.5, 1.0, np.nan]
+    grid = pd.DataFrame([(ctr, cvr) for ctr in values for cvr in values], columns=['Δ_CTR', 'Δ_CVR'])
+
+    expected = grid.apply(define_strategy, axis=1)
+    result = strategy_from_deltas(grid['Δ_CTR'], grid['Δ_CVR'])
+
+    assert list(result.categories) == STRATEGIES
+    assert list(result.astype(str)) == list(expected)
+
+
+def test_compute_kpis_matches_legacy_formulas(report_frame):
+    df = report_frame
+    market_ctr = df["Clicks: Total Count"] / df["Impressions: Total Count"]
+    brand_ctr = df["Clicks: Brand Count"] / df["Impressions: Brand Count"]
+    market_cvr = df["Purchases: Total Count"] / df["Clicks: Total Count"]
+    brand_cvr = df["Purchases: Brand Count"] / df["Clicks: Brand Count"]
+    legacy = pd.DataFrame({'Δ_CTR': brand_ctr - market_ctr, 'Δ_CVR': brand_cvr - market_cvr})
+    # Stratégie identique, calculée sur les Δ d'origine (±inf compris)
+    assert list(df['strategy'].astype(str)) == list(legacy.apply(define_strategy, axis=1))
+
+    # Seule différence voulue dans les colonnes : NaN au lieu de ±inf quand un dénominateur est nul
+    legacy = legacy.replace([np.inf, -np.inf], np.nan)
+    np.testing.assert_allclose(df['Market_CTR'], market_ctr.replace([np.inf, -np.inf], np.nan))
+    np.testing.assert_allclose(df['Δ_CTR'], legacy['Δ_CTR'])
+    np.testing.assert_allclose(df['Δ_CVR'], legacy['Δ_CVR'])
+
+
+# Achats de la marque sans clic de la marque : Brand_CVR infini pour l'ancien calcul,
+# donc Δ_CVR > 0 pour la stratégie, mais NaN dans les colonnes
+def test_zero_brand_denominator_keeps_the_legacy_strategy():
+    df = pd.DataFrame({
+        'Impressions: Total Count': [1000, 1000, 1000], 'Impressions: Brand Count': [100, 100, 0],
+        'Clicks: Total Count': [100, 100, 100], 'Clicks: Brand Count': [0, 0, 0],
+        'Purchases: Total Count': [10, 10, 10], 'Purchases: Brand Count': [3, 0, 0],
+    })
+    result = compute_kpis(df)
+    legacy = df.assign(**{
+        'Δ_CTR': df['Clicks: Brand Count'] / df['Impressions: Brand Count']
+        - df['Clicks: Total Count'] / df['Impressions: Total Count'],
+        'Δ_CVR': df['Purchases: Brand Count'] / df['Clicks: Brand Count']
+        - df['Purchases: Total Count'] / df['Clicks: Total Count'],
+    })
+
+    assert np.isinf(legacy['Δ_CVR'].iloc[0])
+    assert result['Δ_CVR'].isna().all()
+    assert list(result['strategy'].astype(str)) == list(legacy.apply(define_strategy, axis=1))
+    assert result['strategy'].iloc[0] == "Improve CTR"
+
+
+def test_zero_denominator_gives_nan():
+    df = pd.DataFrame({
+        'Impressions: Total Count': [100, 0], 'Impressions: Brand Count': [10, 0],
+        'Clicks: Total Count': [10, 0], 'Clicks: Brand Count': [2, 0],
+        'Purchases: Total Count': [1, 0], 'Purchases: Brand Count': [1, 0],
+    })
+    result = compute_kpis(df)
+
+    assert result['Market_CTR'].tolist()[0] == 0.1
+    assert result[['Market_CTR', 'Brand_CTR', 'Δ_CTR', 'Δ_CVR']].iloc[1].isna().all()
+    assert result['strategy'].iloc[1] == "Reduce Traffic"
+    # compute_kpis ne modifie pas le DataFrame reçu, sauf avec inplace=True
+    assert 'Market_CTR' not in df.columns
+    assert np.isnan(safe_ratio([1.0], [np.nan])[0])
@@ -0,0 +1,76 @@
+import flask
+
+import metrics
+
+
+def test_instrument_records_latency_without_serializing():
+    metrics.registry.clear()
+
+    @metrics.instrument('sample')
+    def sample(x):
+        with metrics.stage('work'):
+            return x * 2
+
+    assert sample(21) == 42
+    text = metrics.registry.render()
+    assert 'amazonkpi_callback_duration_seconds_count{callback="sample",status="ok"} 1' in text
+    assert 'stage="work"' in text
+    # La réponse n'est plus resérialisée dans le temps mesuré
+    assert 'stage="serialize"' not in text
+    assert 'amazonkpi_callback_response_bytes' not in text
+
+
+def test_response_size_is_the_http_body():
+    metrics.registry.clear()
+    server = flask.Flask(__name__)
+    metrics.install_response_size(server)
+
+    @server.route('/_dash-update-component', methods=['POST'])
+    @metrics.instrument('sized')
+    def update():
+        return 'x' * 1234
+
+    @server.route('/other')
+    def other():
+        return 'y' * 10
+
+    client = server.test_client()
+    client.post('/_dash-update-component')
+    client.get('/other')
+
+    text = metrics.registry.render()
+    assert 'amazonkpi_callback_response_bytes_sum{callback="sized"} 1234' in text
+    assert 'amazonkpi_callback_response_bytes_count{callback="sized"} 1' in text
+
+
+def test_captured_measurements_are_recorded_by_replay():
+    import json
+    import multiprocessing
+
+    metrics.registry.clear()
+
+    # Tâche de fond : les mesures sont relevées dans un autre processus et
+    # renvoyées avec le résultat, sous forme de JSON comme dans dcc.Store
+    with multiprocessing.get_context('fork').Pool(1) as pool:
+        measurements = json.loads(pool.apply(_job))
+
+    assert metrics.registry.render().strip() == ''
+    metrics.replay(measurements)
+    text = metrics.registry.render()
+    assert 'amazonkpi_callback_duration_seconds_count{callback="job",status="ok"} 1' in text
+    assert 'amazonkpi_stage_duration_seconds_count{callback="job",stage="index"} 1' in text
+    assert 'amazonkpi_callback_rows_total{callback="job"} 7' in text
+
+
+def _job():
+    import json
+
+    @metrics.instrument('job')
+    def job():
+        with metrics.stage('index'):
+            metrics.add_rows(7)
+
+    with metrics.capture() as measurements:
+        job()
+    assert metrics.registry.render().strip() == ''
+    return json.dumps(measurements)
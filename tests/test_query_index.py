@@ -0,0 +1,48 @@
+import pytest
+
+from query_index import QueryIndex
+
+
+@pytest.fixture
+def index():
+    queries = ['running shoes', 'shoe rack', 'Trail Running Shoes', 'socks', 'shoes for men', 'red shoe']
+    impressions = [500, 300, 900, 1000, 100, 300]
+    return QueryIndex(queries, impressions)
+
+
+def test_empty_text_returns_queries_by_impressions(index):
+    assert index.search('') == ['socks', 'Trail Running Shoes', 'running shoes', 'shoe rack', 'red shoe', 'shoes for men']
+    assert index.search(None, limit=2) == ['socks', 'Trail Running Shoes']
+    assert len(index) == 6
+
+
+def test_prefix_matches_come_before_substring_matches(index):
+    # Préfixes par impressions, puis les autres queries qui contiennent le texte
+    assert index.search('shoe') == ['shoe rack', 'shoes for men', 'Trail Running Shoes', 'running shoes', 'red shoe']
+
+
+def test_search_is_case_insensitive(index):
+    assert index.search('TRAIL') == ['Trail Running Shoes']
+    assert index.search('Running') == ['running shoes', 'Trail Running Shoes']
+
+
+def test_each_query_is_returned_once(index):
+    # 's' apparaît plusieurs fois dans la plupart des queries
+    found = index.search('s')
+    assert len(found) == len(set(found)) == 6
+
+
+def test_limit_keeps_the_best_ranked_matches(index):
+    assert index.search('shoe', limit=1) == ['shoe rack']
+    assert index.search('shoe', limit=3) == ['shoe rack', 'shoes for men', 'Trail Running Shoes']
+
+
+def test_no_match(index):
+    assert index.search('laptop') == []
+    # Le séparateur interne des queries ne doit pas produire de correspondance
+    assert index.search('shoes\nsocks') == []
+
+
+def test_ties_keep_the_import_order():
+    index = QueryIndex(['b', 'a', 'c'], [1, 1, 1])
+    assert index.search('') == ['b', 'a', 'c']
@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dataset import Dataset
+from raw_table import filtered_order, split_filter_part, table_page
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame({
+        'Search Query': pd.Categorical(['protein bar', 'vegan bar', 'whey', None]),
+        'Reporting Date': pd.to_datetime(['2024-01-06', '2024-01-13', '2024-01-13', None]),
+        'Impressions: Total Count': np.array([100, 250, 40, 7], dtype='int32'),
+        'Δ_CTR': np.array([0.5, -0.25, np.nan, 0.0], dtype='float32'),
+    })
+
+
+@pytest.mark.parametrize('filter_part, expected', [
+    ('{Impressions: Total Count} > 120', ('Impressions: Total Count', 'gt', 120.0)),
+    ('{Impressions: Total Count} ge 40', ('Impressions: Total Count', 'ge', 40.0)),
+    ('{Search Query} contains "bar"', ('Search Query', 'contains', 'bar')),
+    ("{Search Query} = 'it\\'s'", ('Search Query', 'eq', "it's")),
+    ('{Reporting Date} datestartswith 2024-01', ('Reporting Date', 'datestartswith', '2024-01')),
+    ('{Search Query} s= abc', ('Search Query', 'eq', 'abc')),
+])
+def test_split_filter_part(filter_part, expected):
+    assert split_filter_part(filter_part) == expected
+
+
+def test_split_filter_part_without_operator():
+    assert split_filter_part('{Search Query}') == [None] * 3
+
+
+@pytest.mark.parametrize('filter_query, expected', [
+    ('{Impressions: Total Count} > 50', [0, 1]),
+    ('{Impressions: Total Count} <= 40', [2, 3]),
+    ('{Search Query} contains BAR', [0, 1]),
+    ('{Search Query} = whey', [2]),
+    ('{Reporting Date} datestartswith 2024-01-13', [1, 2]),
+    ('{Reporting Date} >= 2024-01-10', [1, 2]),
+    ('{Δ_CTR} < 0', [1]),
+    ('{Search Query} contains bar && {Impressions: Total Count} > 150', [1]),
+    ('{Unknown column} > 3', [0, 1, 2, 3]),
+])
+def test_filtered_order(frame, filter_query, expected):
+    assert filtered_order(frame, filter_query, []).tolist() == expected
+
+
+# Une valeur non numérique sur une colonne numérique ne retient aucune ligne
+# (au lieu de lever TypeError dans le callback)
+@pytest.mark.parametrize('filter_query', [
+    '{Impressions: Total Count} > abc',
+    '{Impressions: Total Count} = "12a"',
+    '{Δ_CTR} <= x',
+    '{Reporting Date} > not-a-date',
+])
+def test_non_numeric_value_matches_nothing(frame, filter_query):
+    assert filtered_order(frame, filter_query, []).tolist() == []
+
+
+def test_sort_is_stable_with_missing_values_last(frame):
+    sort_by = [{'column_id': 'Δ_CTR', 'direction': 'desc'}]
+    assert filtered_order(frame, '', sort_by).tolist() == [0, 3, 1, 2]
+
+
+def test_table_page_on_compact_dataset(report_frame):
+    dataset = Dataset(report_frame)
+    sort_by = [{'column_id': 'Impressions: Total Count', 'direction': 'desc'}]
+    rows, page_count = table_page(dataset.df, 1, 25, sort_by, '{Impressions: Total Count} > 1000',
+                                  cache_key='test')
+
+    expected = report_frame[report_frame['Impressions: Total Count'] > 1000]
+    expected = expected.sort_values('Impressions: Total Count', ascending=False, kind='stable')
+    assert page_count == -(-len(expected) // 25)
+    assert [row['Impressions: Total Count'] for row in rows] == \
+        expected['Impressions: Total Count'].iloc[25:50].tolist()
+    # Dates au format des filtres et float32 affichés sans bruit d'arrondi
+    assert rows[0]['Reporting Date'] == expected['Reporting Date'].iloc[25].strftime('%Y-%m-%d')
+    assert rows[0]['Clicks: Price (Median)'] == expected['Clicks: Price (Median)'].iloc[25]
+
+
+# Flottants affichés à 1 décimale : les filtres portent sur ces valeurs affichées
+def test_table_page_rounds_and_filters_displayed_values(report_frame):
+    dataset = Dataset(report_frame)
+    rows, _ = table_page(dataset.df, 0, 1000, [], '{Δ_CTR} = 0.1', decimals=1)
+
+    expected = report_frame[report_frame['Δ_CTR'].round(1) == 0.1]
+    assert len(rows) == len(expected) > 0
+    assert {row['Δ_CTR'] for row in rows} == {0.1}
+    assert rows[0]['Clicks: Click Rate %'] == round(expected['Clicks: Click Rate %'].iloc[0], 1)
@@ -0,0 +1,37 @@
+import os
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from report_cache import ReportCache  # noqa: E402
+
+
+def test_save_and_load(tmp_path):
+    cache = ReportCache(str(tmp_path / 'reports'))
+    cache.save('abc', pd.DataFrame({'Search Query': ['a', 'b'], 'Impressions: Total Count': [1, 2]}))
+    assert 'abc' in cache
+    assert cache.load('abc')['Impressions: Total Count'].tolist() == [1, 2]
+    assert 'missing' not in cache and cache.load('missing') is None
+
+
+@pytest.mark.skipif(not hasattr(os, 'getuid'), reason="POSIX permissions")
+def test_directory_is_private(tmp_path):
+    directory = tmp_path / 'reports'
+    directory.mkdir(mode=0o777)
+    os.chmod(directory, 0o777)
+    ReportCache(str(directory))
+    assert os.stat(directory).st_mode & 0o777 == 0o700
+
+
+@pytest.mark.skipif(not hasattr(os, 'getuid'), reason="POSIX permissions")
+def test_entries_of_another_user_are_ignored(tmp_path, monkeypatch):
+    cache = ReportCache(str(tmp_path / 'reports'))
+    cache.save('abc', pd.DataFrame({'Search Query': ['a']}))
+
+    # Fichier déposé par un autre utilisateur : ni trouvé ni relu
+    uid = os.getuid()
+    monkeypatch.setattr(os, 'getuid', lambda: uid + 1)
+    assert 'abc' not in cache
+    assert cache.load('abc') is None
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from generate_reports import generate_frame
+from kpi import compute_kpis
+from rollup import COUNT_COLUMNS, GRAINS, RollupCube
+
+
+@pytest.fixture(scope='module')
+def frame():
+    return compute_kpis(generate_frame(30, 30, seed=11))
+
+
+@pytest.fixture(scope='module')
+def cube(frame):
+    return RollupCube(frame)
+
+
+# Somme directe des lignes dont la Reporting Date est dans [start, end]
+def _weekly_sum(frame, queries, start, end):
+    dates = frame['Reporting Date']
+    rows = frame[(dates >= pd.Timestamp(start)) & (dates <= pd.Timestamp(end))]
+    if queries:
+        rows = rows[rows['Search Query'].isin(queries)]
+    return rows[COUNT_COLUMNS].fillna(0).sum().astype('int64')
+
+
+# Plages qui coupent des mois et des trimestres en leur milieu, ou les couvrent exactement
+@pytest.mark.parametrize('grain', GRAINS)
+@pytest.mark.parametrize('offsets', [(0, -1), (3, 17), (5, 6), (9, 22)])
+def test_range_totals_match_weekly_sum(frame, cube, grain, offsets):
+    weeks = pd.DatetimeIndex(cube.periods('week'))
+    start, end = weeks[offsets[0]], weeks[offsets[1]]
+    queries = list(frame['Search Query'].unique()[:4])
+
+    for selected in (None, queries):
+        expected = _weekly_sum(frame, selected, start, end)
+        total = cube.total(grain, selected, start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'))
+        assert total[COUNT_COLUMNS].astype('int64').tolist() == expected.tolist()
+
+
+def test_partial_edge_periods_are_clipped_and_flagged(frame, cube):
+    weeks = pd.DatetimeIndex(cube.periods('week'))
+    # Du milieu du premier mois complet au milieu d'un mois suivant
+    start, end = weeks[6], weeks[15]
+
+    series = cube.series('month', None, start, end)
+    assert series['Partial'].iloc[0] and series['Partial'].iloc[-1]
+    assert not series['Partial'].iloc[1:-1].any()
+
+    first_month = series['Period'].iloc[0]
+    month_end = first_month + pd.offsets.MonthEnd(0)
+    expected = _weekly_sum(frame, None, start, month_end)
+    assert series[COUNT_COLUMNS].iloc[0].tolist() == expected.tolist()
+
+
+def test_periods_outside_the_range_are_dropped(cube):
+    weeks = pd.DatetimeIndex(cube.periods('week'))
+    series = cube.series('quarter', None, weeks[2], weeks[3])
+    assert len(series) == 1
+    assert np.isin(series['Period'], cube.periods('quarter')).all()
@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from generate_reports import generate_frame
+from kpi import compute_kpis
+from trends import MIN_STD, TREND_WINDOW, alerts, compute_trends
+
+DATES = pd.date_range('2024-01-06', periods=6, freq='7D')
+
+
+# Rapports d'une query : une ligne par semaine, Δ et stratégies donnés
+def _query(name, delta_ctr, delta_cvr=None, strategies=None, impressions=1000):
+    n = len(delta_ctr)
+    return pd.DataFrame({
+        'Search Query': name,
+        'Reporting Date': DATES[:n],
+        'Impressions: Total Count': impressions,
+        'Δ_CTR': delta_ctr,
+        'Δ_CVR': delta_cvr if delta_cvr is not None else [0.01, 0.02, 0.01, 0.02, 0.01, 0.02][:n],
+        'strategy': strategies or ['Improve CTR'] * n,
+    })
+
+
+@pytest.fixture
+def reports():
+    frame = pd.concat([
+        # Δ_CTR stable puis en chute sur le dernier rapport
+        _query('drop', [0.10, 0.11, 0.10, 0.11, 0.10, -0.20]),
+        # Stratégie qui change sur le dernier rapport, Δ sans écart
+        _query('switch', [0.05, 0.06, 0.05, 0.06, 0.05, 0.055],
+               strategies=['Improve CTR'] * 5 + ['Improve CVR']),
+        # Stratégie qui change avant le dernier rapport seulement
+        _query('earlier', [0.05, 0.06, 0.05, 0.06, 0.05, 0.055],
+               strategies=['Improve CTR', 'Improve CTR', 'Reduce Traffic', 'Reduce Traffic',
+                           'Reduce Traffic', 'Reduce Traffic']),
+        # Δ_CVR constant puis en hausse : écart type nul, remplacé par MIN_STD
+        _query('flat', [0.05, 0.06, 0.05, 0.06, 0.05, 0.055], delta_cvr=[0.02] * 5 + [0.5]),
+        # Trop peu de rapports pour une fenêtre complète
+        _query('short', [0.10, 0.12, 0.90]),
+    ], ignore_index=True)
+    # Ordre des lignes quelconque
+    return frame.sample(frac=1, random_state=0).reset_index(drop=True)
+
+
+def test_rows_are_sorted_by_query_then_date(reports):
+    trends = compute_trends(reports)
+    assert len(trends) == len(reports)
+    for _, block in trends.groupby('Search Query', sort=False):
+        assert block['Reporting Date'].is_monotonic_increasing
+    assert trends.groupby('Search Query')['Latest'].sum().eq(1).all()
+
+
+def test_strategy_change_is_flagged_on_the_transition_only(reports):
+    trends = compute_trends(reports).set_index(['Search Query', 'Reporting Date'])
+    changes = trends[trends['Strategy change']]
+    assert sorted(changes.index) == [('earlier', DATES[2]), ('switch', DATES[5])]
+    assert changes.loc[('switch', DATES[5]), 'Previous strategy'] == 'Improve CTR'
+    # Premier rapport d'une query : pas de stratégie précédente
+    assert pd.isna(trends.loc[('drop', DATES[0]), 'Previous strategy'])
+
+
+def test_wow_and_rolling_window(reports):
+    trends = compute_trends(reports).set_index(['Search Query', 'Reporting Date'])
+    drop = trends.loc['drop']
+    assert np.isnan(drop['Δ_CTR WoW'].iloc[0])
+    assert drop['Δ_CTR WoW'].iloc[-1] == pytest.approx(-0.30)
+    # Moyenne des TREND_WINDOW rapports précédents, sans le rapport lui-même
+    assert drop['Δ_CTR rolling mean'].iloc[-1] == pytest.approx(np.mean([0.11, 0.10, 0.11, 0.10]))
+    previous = np.array([0.11, 0.10, 0.11, 0.10])
+    expected = (-0.20 - previous.mean()) / previous.std(ddof=1)
+    assert drop['Δ_CTR z-score'].iloc[-1] == pytest.approx(expected)
+
+
+def test_z_score_needs_a_full_window(reports):
+    trends = compute_trends(reports).set_index(['Search Query', 'Reporting Date'])
+    assert trends.loc['short', 'Δ_CTR z-score'].isna().all()
+    assert trends.loc['drop', 'Δ_CTR z-score'].iloc[:TREND_WINDOW].isna().all()
+    # Fenêtre partielle acceptée avec min_periods
+    short = compute_trends(reports, min_periods=2).set_index(['Search Query', 'Reporting Date']).loc['short']
+    assert short['Δ_CTR z-score'].notna().tolist() == [False, False, True]
+
+
+# Fenêtre plate : le rapport qui s'en écarte a un z-score calculé avec MIN_STD,
+# celui qui reste au même niveau un z-score nul
+def test_flat_window_uses_the_minimum_std(reports):
+    trends = compute_trends(reports).set_index(['Search Query', 'Reporting Date'])
+    assert trends.loc[('flat', DATES[5]), 'Δ_CVR z-score'] == pytest.approx((0.5 - 0.02) / MIN_STD)
+    assert trends.loc[('flat', DATES[4]), 'Δ_CVR z-score'] == pytest.approx(0.0)
+
+    # Δ stables puis en chute brutale : signalé
+    frame = _query('jump', [0.02, 0.03, 0.01, 0.02, 0.03, -0.4])
+    assert alerts(compute_trends(frame)).loc[0, 'Alert'] == 'Δ_CTR drop'
+    frame = _query('jump', [0.0, 0.0, 0.0, 0.0, 0.0, -0.4])
+    assert alerts(compute_trends(frame)).loc[0, 'Alert'] == 'Δ_CTR drop'
+
+
+def test_alerts_keep_the_latest_flagged_report_by_severity(reports):
+    result = alerts(compute_trends(reports))
+    assert list(result['Search Query']) == ['flat', 'drop', 'switch']
+    assert list(result['Alert']) == ['Δ_CVR rise', 'Δ_CTR drop', 'Strategy change']
+    assert result.loc[0, 'Severity'] > result.loc[1, 'Severity'] > 2
+    assert (result['Reporting Date'] == DATES[5]).all()
+
+
+def test_alerts_combine_labels():
+    frame = _query('both', [0.10, 0.11, 0.10, 0.11, 0.10, 0.80],
+                   delta_cvr=[0.01, 0.02, 0.01, 0.02, 0.01, -0.50],
+                   strategies=['Improve CTR'] * 5 + ['Reduce Traffic'])
+    result = alerts(compute_trends(frame), z_threshold=2.0)
+    assert result.loc[0, 'Alert'] == 'Strategy change, Δ_CTR rise, Δ_CVR drop'
+
+
+# Mêmes mesures qu'un calcul pandas par query (groupby + rolling)
+def test_matches_groupby_rolling_reference():
+    frame = compute_kpis(generate_frame(40, 12, seed=7)).sample(frac=1, random_state=1)
+    trends = compute_trends(frame).set_index(['Search Query', 'Reporting Date'])
+
+    ref = frame.sort_values(['Search Query', 'Reporting Date'], kind='stable')
+    groups = ref.groupby('Search Query', sort=False, observed=True)
+    ref = ref.set_index(['Search Query', 'Reporting Date'])
+    for col in ['Δ_CTR', 'Δ_CVR']:
+        previous = groups[col].shift(1).to_numpy()
+        mean = groups[col].transform(lambda s: s.shift(1).rolling(TREND_WINDOW, min_periods=1).mean())
+        std = groups[col].transform(lambda s: s.shift(1).rolling(TREND_WINDOW, min_periods=TREND_WINDOW).std())
+        z_score = (ref[col].to_numpy() - mean.to_numpy()) / np.maximum(std.to_numpy(), MIN_STD)
+        expected = pd.DataFrame({'wow': ref[col].to_numpy() - previous, 'mean': mean.to_numpy(), 'z': z_score},
+                                index=ref.index).reindex(trends.index)
+        np.testing.assert_allclose(trends[f'{col} WoW'], expected['wow'], equal_nan=True)
+        np.testing.assert_allclose(trends[f'{col} rolling mean'], expected['mean'], equal_nan=True)
+        np.testing.assert_allclose(trends[f'{col} z-score'], expected['z'], equal_nan=True, atol=1e-6)
@@ -0,0 +1,130 @@
+# Tendances et changements de stratégie de toutes les Search Query, en une passe.
+#
+# Les lignes sont triées une fois par (query, date) : chaque query forme alors
+# un bloc contigu, et toutes les mesures sont calculées sur les tableaux numpy
+# triés à partir des bornes de ces blocs, sans boucle par query :
+#   - variation d'un rapport à l'autre (WoW) de Δ_CTR et Δ_CVR,
+#   - moyenne et écart type glissants des `window` rapports précédents, et
+#     z-score du rapport par rapport à cette fenêtre (écart type d'au moins MIN_STD),
+#   - stratégie précédente et changement de stratégie.
+#
+# Comme kpi, ce module ne dépend que de pandas / numpy (utilisable depuis batch.py).
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from kpi import STRATEGY_DTYPE
+
+# Nombre de rapports précédents de la fenêtre glissante
+TREND_WINDOW = 4
+# |z-score| à partir duquel un Δ est signalé
+Z_THRESHOLD = 2.0
+# Écart type minimal des fenêtres (0.005 = un demi-point de CTR / CVR) : une
+# série plate (écart type nul ou presque) qui décroche a un z-score fini et
+# élevé au lieu de ne jamais être signalée
+MIN_STD = 0.005
+
+DELTA_COLUMNS = ['Δ_CTR', 'Δ_CVR']
+
+ALERT_COLUMNS = [
+    'Search Query', 'Reporting Date', 'Alert', 'Severity', 'Previous strategy', 'strategy',
+    'Impressions: Total Count',
+    'Δ_CTR', 'Δ_CTR WoW', 'Δ_CTR rolling mean', 'Δ_CTR z-score',
+    'Δ_CVR', 'Δ_CVR WoW', 'Δ_CVR rolling mean', 'Δ_CVR z-score',
+]
+
+
+# Moyenne, écart type (ddof=1) et nombre de valeurs des `window` lignes
+# précédentes du même bloc. Fenêtres lues comme des vues (sliding_window_view) :
+# calcul exact, contrairement à des différences de sommes cumulées sur des
+# millions de lignes, et en O(lignes x window)
+def _trailing(values, block_start, window):
+    n = len(values)
+    padded = np.concatenate([np.full(window, np.nan), values])
+    # Ligne i : values[i - window:i]
+    windows = sliding_window_view(padded, window)[:n]
+    positions = np.arange(n)[:, None] - window + np.arange(window)[None, :]
+    windows = np.where(positions >= block_start[:, None], windows, np.nan)
+
+    valid = ~np.isnan(windows)
+    count = valid.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(valid, windows, 0.0).sum(axis=1) / count
+        deviations = np.where(valid, windows - mean[:, None], 0.0)
+        variance = (deviations * deviations).sum(axis=1) / (count - 1)
+    std = np.sqrt(np.where(count > 1, variance, np.nan))
+    return mean, std, count
+
+
+# Mesures de tendance de chaque ligne (query, date), triées par query puis par date.
+# Un z-score n'est calculé qu'avec au moins `min_periods` rapports précédents
+def compute_trends(df, window=TREND_WINDOW, min_periods=None):
+    min_periods = window if min_periods is None else min_periods
+
+    codes, _ = pd.factorize(df['Search Query'], sort=False)
+    dates = df['Reporting Date'].to_numpy(dtype='datetime64[ns]')
+    order = np.lexsort((dates.view('int64'), codes))
+    order = order[(codes[order] >= 0) & ~np.isnat(dates[order])]
+    codes = codes[order]
+
+    block_first = np.r_[True, codes[1:] != codes[:-1]] if len(codes) else np.zeros(0, dtype=bool)
+    block_last = np.r_[codes[1:] != codes[:-1], True] if len(codes) else np.zeros(0, dtype=bool)
+    # Position de la première ligne du bloc de chaque ligne
+    block_start = np.maximum.accumulate(np.where(block_first, np.arange(len(codes)), 0))
+
+    trends = pd.DataFrame({
+        'Search Query': df['Search Query'].to_numpy()[order],
+        'Reporting Date': dates[order],
+        'Impressions: Total Count': df['Impressions: Total Count'].to_numpy()[order],
+    })
+
+    for col in DELTA_COLUMNS:
+        values = df[col].to_numpy(dtype='float64')[order]
+        previous = np.r_[np.nan, values[:-1]] if len(values) else values
+        mean, std, count = _trailing(values, block_start, window)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            z_score = np.where(count >= min_periods, (values - mean) / np.maximum(std, MIN_STD), np.nan)
+
+        trends[col] = values
+        trends[f'{col} WoW'] = np.where(block_first, np.nan, values - previous)
+        trends[f'{col} rolling mean'] = mean
+        trends[f'{col} z-score'] = z_score
+
+    strategy = pd.Categorical(df['strategy'], dtype=STRATEGY_DTYPE).codes[order]
+    previous = np.where(block_first, -1, np.r_[-1, strategy[:-1]] if len(strategy) else strategy).astype('int8')
+    trends['Previous strategy'] = pd.Categorical.from_codes(previous, dtype=STRATEGY_DTYPE)
+    trends['strategy'] = pd.Categorical.from_codes(strategy, dtype=STRATEGY_DTYPE)
+    trends['Strategy change'] = (previous >= 0) & (strategy >= 0) & (previous != strategy)
+    trends['Latest'] = block_last
+    return trends
+
+
+# Vue "Alerts" : dernier rapport de chaque query qui change de stratégie ou dont
+# un Δ s'écarte de plus de z_threshold écarts types de sa fenêtre, triée par
+# sévérité (plus grand |z-score|) décroissante
+def alerts(trends, z_threshold=Z_THRESHOLD):
+    latest = trends[trends['Latest'].to_numpy()]
+
+    flags = [(latest['Strategy change'].to_numpy(), "Strategy change")]
+    for col in DELTA_COLUMNS:
+        z_score = latest[f'{col} z-score'].to_numpy()
+        flags.append((z_score <= -z_threshold, f"{col} drop"))
+        flags.append((z_score >= z_threshold, f"{col} rise"))
+
+    flagged = np.zeros(len(latest), dtype=bool)
+    labels = np.full(len(latest), '', dtype=object)
+    for mask, label in flags:
+        labels = np.where(mask, np.where(flagged, labels + ', ' + label, label), labels)
+        flagged |= mask
+
+    result = latest[flagged].copy()
+    result['Alert'] = labels[flagged]
+    z_scores = result[[f'{col} z-score' for col in DELTA_COLUMNS]].abs()
+    result['Severity'] = z_scores.max(axis=1)
+
+    decimals = {col: 4 for col in result.columns if col.startswith('Δ_')}
+    decimals['Severity'] = 2
+    result = result.round(decimals)
+    result = result.sort_values(['Severity', 'Impressions: Total Count'], ascending=False,
+                                kind='stable', na_position='last')
+    return result[ALERT_COLUMNS].reset_index(drop=True)